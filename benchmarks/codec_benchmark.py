@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Output Codecs Benchmark
+-----------------------------------------------
+Encodes the images of a folder with every output codec of image_codecs.py,
+serially and on a thread pool, and prints the encode throughput (MB/s of
+decoded pixels) and the output size of every codec.
+
+Usage: python benchmarks/codec_benchmark.py [image folder] [threads]
+"""
+
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from image_codecs import codec_parser  # noqa: E402
+from fi_discovery import image_scanner  # noqa: E402
+
+DEFAULT_FOLDER = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.realpath(__file__))),
+    "images",
+    "normal_image_folders",
+    "rgb_images",
+)
+CODECS = [
+    "same",
+    "png",
+    "png:0",
+    "png:1",
+    "png:3",
+    "png:9",
+    "webp",
+    "tiff:none",
+    "tiff:lzw",
+    "tiff:deflate",
+    "tiff:packbits",
+    "bmp",
+]
+
+
+def encode_timer(images, out_format, codec_params, threads):
+    """Returns the encode time (s) and the total output size of the images."""
+
+    def encoder(image):
+        return len(cv2.imencode(out_format, image, codec_params)[1])
+
+    start = time.perf_counter()
+    if threads <= 1:
+        sizes = [encoder(image) for image in images]
+    else:
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            sizes = list(executor.map(encoder, images))
+    return time.perf_counter() - start, sum(sizes)
+
+
+def main(ndir_name=DEFAULT_FOLDER, threads=os.cpu_count() or 1):
+    """Benchmark main function"""
+    ndir_name = os.path.join(ndir_name, "")
+    img_formats = image_scanner(ndir_name)
+    img_format = next(iter(img_formats.values()), ".png")
+    images = [
+        cv2.imread(ndir_name + img_name + name_format)
+        for img_name, name_format in img_formats.items()
+    ]
+    images = [image for image in images if image is not None]
+    pixel_mb = sum(image.nbytes for image in images) / 1e6
+    print(
+        f"{len(images)} images, {pixel_mb:.1f} MB decoded, input format "
+        f"{img_format}, {threads} encoder threads"
+    )
+    print(
+        f"{'codec':<15}{'serial MB/s':>12}{'pool MB/s':>11}{'output MB':>11}"
+        f"{'ratio':>8}"
+    )
+    for codec in CODECS:
+        out_format, codec_params = codec_parser(codec, img_format)
+        encode_timer(images[:1], out_format, codec_params, 1)  # warm-up
+        serial_s, out_size = encode_timer(images, out_format, codec_params, 1)
+        pool_s, _ = encode_timer(images, out_format, codec_params, threads)
+        print(
+            f"{codec:<15}{pixel_mb / serial_s:>12.1f}{pixel_mb / pool_s:>11.1f}"
+            f"{out_size / 1e6:>11.2f}{out_size / 1e6 / pixel_mb:>8.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main(
+        sys.argv[1] if len(sys.argv) > 1 else DEFAULT_FOLDER,
+        int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count() or 1,
+    )
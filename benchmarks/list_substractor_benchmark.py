@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+List Substractor Benchmark
+-----------------------------------------------
+Measures the repeated FI exclusion (list_substractor) at library sizes up to
+1M image names with 50% of the names already fault injected. The old list
+based exclusion (O(n * m)) is only measured on the small libraries.
+
+Usage: python benchmarks/list_substractor_benchmark.py
+"""
+
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from offline_fault_injector_ui import list_substractor  # noqa: E402
+from class_list_creator import ListCreator  # noqa: E402
+
+LIBRARY_SIZES = [1000, 10000, 100000, 1000000]
+OLD_METHOD_MAX_SIZE = 10000
+
+
+def old_list_substractor(norm_img_list, fi_img_list):
+    """List based exclusion used before (O(n * m))."""
+    return [x for x in norm_img_list if x not in fi_img_list]
+
+
+def timer(func, *args):
+    """Returns the run time (s) and the output of func."""
+    start = time.perf_counter()
+    output = func(*args)
+    return time.perf_counter() - start, output
+
+
+def main():
+    """Benchmark main function"""
+    print(f"{'images':>9}{'set s':>10}{'ListCreator s':>15}{'old list s':>12}")
+    for size in LIBRARY_SIZES:
+        norm_img_list = [f"{i // 50}_{i % 50}" for i in range(size)]
+        fi_img_list = random.Random(0).sample(norm_img_list, size // 2)
+
+        new_time, remain_list = timer(list_substractor, norm_img_list, fi_img_list)
+        creator_time, _ = timer(
+            ListCreator.__sub__, ListCreator(*norm_img_list), fi_img_list
+        )
+        old_time = "-"
+        if size <= OLD_METHOD_MAX_SIZE:
+            old_seconds, old_remain_list = timer(
+                old_list_substractor, norm_img_list, fi_img_list
+            )
+            assert old_remain_list == remain_list
+            old_time = f"{old_seconds:.3f}"
+        print(f"{size:>9}{new_time:>10.3f}{creator_time:>15.3f}{old_time:>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Morphology Kernels Benchmark
+-----------------------------------------------
+Compares the Erosion/Dilation/Gradient calls used by OfflineImageFault before
+(cv2 with iterations=5) with the methods of morphology_kernels.py over the
+1-100% fault rate range of the GUI slider. Every output is checked to be
+bit-identical to the old call.
+
+Usage: python benchmarks/morphology_benchmark.py [repeat] [rate step]
+"""
+
+import os
+import sys
+import time
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+import morphology_kernels as mk  # noqa: E402
+from class_fi_offline_ui import OfflineImageFault as ofi  # noqa: E402
+
+IMAGE_SHAPE = (1080, 1920, 3)
+METHODS = ("cv2", "separable", "vhgw", "auto")
+
+
+def timer(func, repeat):
+    """Returns the mean run time (ms) and the last output of func."""
+    output = func()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        output = func()
+    return (time.perf_counter() - start) / repeat * 1000, output
+
+
+def old_morphology(image, fault_type, kernel):
+    """Morphology calls of OfflineImageFault before morphology_kernels.py"""
+    if fault_type == "e":
+        return cv2.erode(image, kernel, iterations=5)
+    if fault_type == "d":
+        return cv2.dilate(image, kernel, iterations=5)
+    return cv2.morphologyEx(image, cv2.MORPH_GRADIENT, kernel)
+
+
+def new_morphology(image, fault_type, kernel_size, method):
+    """Morphology with a morphology_kernels.py method"""
+    if fault_type == "gr":
+        return mk.rect_gradient(image, kernel_size, method=method)
+    return mk.rect_morphology(image, fault_type, kernel_size, 5, method=method)
+
+
+def main(repeat=3, rate_step=1):
+    """Benchmark main function"""
+    image = np.random.default_rng(0).integers(0, 256, IMAGE_SHAPE, dtype=np.uint8)
+    print(f"image {IMAGE_SHAPE}, OpenCV threads: {cv2.getNumThreads()}")
+    print(
+        f"{'fault':<7}{'rate %':>7}{'window':>8}{'old ms':>9}"
+        + "".join(f"{method + ' ms':>14}" for method in METHODS)
+        + "   identical"
+    )
+    for fault_type in ("e", "d", "gr"):
+        for rate in range(1, 101, rate_step):
+            kernel = ofi.fault_kernel(rate / 100)
+            window, _ = mk.folded_window(
+                kernel.shape[0], 1 if fault_type == "gr" else 5
+            )
+            old_ms, old_out = timer(
+                lambda: old_morphology(image, fault_type, kernel), repeat
+            )
+            line = f"{fault_type:<7}{rate:>7}{window:>8}{old_ms:>9.2f}"
+            identical = True
+            for method in METHODS:
+                new_ms, new_out = timer(
+                    lambda: new_morphology(image, fault_type, kernel.shape[0], method),
+                    repeat,
+                )
+                identical = identical and np.array_equal(old_out, new_out)
+                line += f"{new_ms:>14.2f}"
+            print(line + "   " + str(identical))
+
+
+if __name__ == "__main__":
+    main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 3,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 1,
+    )
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Noise Kernels Benchmark
+-----------------------------------------------
+Compares the native noise kernels (noise_kernels.py) with the imgaug path used
+by OfflineImageFault before (a new augmenter for every image). Prints the time
+per image of imgaug, of the kernels without a Generator and of the kernels
+with a seeded Generator (the path of the offline FI engine, see
+noise_kernels.image_rng), the speedup of the engine path and the mean/std of
+the imgaug and the engine outputs so that the statistics can be compared.
+
+Usage: python benchmarks/noise_kernels_benchmark.py [repeat]
+"""
+
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+import noise_kernels as nk  # noqa: E402
+from class_fi_offline_ui import OfflineImageFault as ofi  # noqa: E402
+
+IMAGE_SHAPES = [(128, 128), (240, 320), (480, 640, 3), (1080, 1920, 3)]
+FAULT_RATE = 0.1
+
+FAULTS = {
+    "Salt&Pepper": (
+        ofi.salt_pepper,
+        lambda img, rng: nk.salt_pepper(img, FAULT_RATE, rng),
+    ),
+    "Gaussian": (
+        ofi.gaussian,
+        lambda img, rng: nk.gaussian_noise(img, FAULT_RATE * 255, rng),
+    ),
+    "Poisson": (
+        ofi.poisson,
+        lambda img, rng: nk.poisson_noise(img, float(FAULT_RATE * 100), rng),
+    ),
+}
+
+
+def timer(func, repeat):
+    """Returns the mean run time (ms) and the last output of func."""
+    output = func()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        output = func()
+    return (time.perf_counter() - start) / repeat * 1000, output
+
+
+def main(repeat=20):
+    """Benchmark main function"""
+    rng = np.random.default_rng(0)
+    print(
+        f"{'fault':<12}{'shape':<18}{'imgaug ms':>10}{'no rng ms':>10}"
+        f"{'seeded ms':>10}{'speedup':>9}   mean/std imgaug | seeded"
+    )
+    for shape in IMAGE_SHAPES:
+        image = rng.integers(0, 256, shape, dtype=np.uint8)
+        for fault_name, (augmenter, kernel) in FAULTS.items():
+            aug_ms, aug_out = timer(
+                lambda: augmenter(FAULT_RATE).augment_image(image), repeat
+            )
+            free_ms, _ = timer(lambda: kernel(image, None), repeat)
+            seeded_ms, seeded_out = timer(lambda: kernel(image, rng), repeat)
+            print(
+                f"{fault_name:<12}{str(shape):<18}{aug_ms:>10.3f}{free_ms:>10.3f}"
+                f"{seeded_ms:>10.3f}{aug_ms / seeded_ms:>8.1f}x   "
+                f"{aug_out.mean():.2f}/{aug_out.std():.2f} | "
+                f"{seeded_out.mean():.2f}/{seeded_out.std():.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20)
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+TOF Fault Path Benchmark
+-----------------------------------------------
+Compares the TOF fault path of OfflineImageFault before (PIL decode,
+np.asarray, a new imgaug augmenter per image, Image.fromarray(...).convert("L"),
+np.array) with the single-decode path (OpenCV decode, native noise kernels in
+place, PIL's grayscale formula into one output buffer). It is for timing
+only, tests/test_tof_path.py checks that the new path gives the outputs of the
+PIL decode and conversion.
+
+It prints the time and the peak of the allocated memory per image of the old
+and the new path, in frames (decoded image sizes). The peak is measured with
+tracemalloc, which sees the numpy buffers but not the internal image buffers
+of PIL, so the real peak of the old path is one frame (decoded image) + one
+grayscale frame higher.
+
+Usage: python benchmarks/tof_path_benchmark.py [image folder] [repeat]
+"""
+
+import os
+import sys
+import time
+import tracemalloc
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+import noise_kernels as nk  # noqa: E402
+from class_fi_offline_ui import OfflineImageFault as ofi  # noqa: E402
+from fi_discovery import image_scanner  # noqa: E402
+
+DEFAULT_FOLDER = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.realpath(__file__))),
+    "images",
+    "normal_image_folders",
+    "tof_images",
+)
+FAULT_RATE = 0.1
+FAULTS = ("nf", "s", "g", "p")
+
+
+def noise_fault(image, fault_type, rng, out=None):
+    """TOF fault of tof_image_fault with a noise Generator"""
+    if fault_type == "s":
+        return nk.salt_pepper(image, FAULT_RATE, rng, out=out)
+    if fault_type == "g":
+        return nk.gaussian_noise(image, FAULT_RATE * 255, rng, out=out)
+    if fault_type == "p":
+        return nk.poisson_noise(image, float(FAULT_RATE * 100), rng, out=out)
+    return image
+
+
+def old_tof_path(img_path, fault_type, rng=None):
+    """TOF fault path before the single-decode path (imgaug augmenters)"""
+    im_arr = np.asarray(Image.open(img_path))
+    if fault_type != "nf":
+        augmenters = {"s": ofi.salt_pepper, "g": ofi.gaussian, "p": ofi.poisson}
+        im_arr = augmenters[fault_type](FAULT_RATE).augment_image(im_arr)
+    image_file = Image.fromarray(im_arr).convert("L")
+    return np.array(image_file)
+
+
+def new_tof_path(img_path, fault_type, rng):
+    """Single-decode TOF fault path of OfflineImageFault"""
+    im_arr = ofi.tof_decoder(img_path)
+    out = im_arr if im_arr.flags.writeable else None
+    im_arr = noise_fault(im_arr, fault_type, rng, out=out)
+    return ofi.gray_converter(im_arr)
+
+
+def peak_counter(tof_path, img_paths, fault_type):
+    """Mean traced peak memory (bytes) per image."""
+    rng = np.random.default_rng(2)
+    tof_path(img_paths[0], fault_type, rng)  # warm-up (tables, caches)
+    peak_bytes = 0
+    for img_path in img_paths:
+        tracemalloc.start()
+        tof_path(img_path, fault_type, rng)
+        peak_bytes += tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return peak_bytes / len(img_paths)
+
+
+def timer(tof_path, img_paths, fault_type, repeat):
+    """Mean run time (ms) per image"""
+    rng = np.random.default_rng(3)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for img_path in img_paths:
+            tof_path(img_path, fault_type, rng)
+    return (time.perf_counter() - start) / (repeat * len(img_paths)) * 1000
+
+
+def main(ndir_name=DEFAULT_FOLDER, repeat=10):
+    """Benchmark main function"""
+    ndir_name = os.path.join(ndir_name, "")
+    img_paths = [
+        ndir_name + img_name + img_format
+        for img_name, img_format in image_scanner(ndir_name).items()
+    ]
+    frame_bytes = np.mean([ofi.tof_decoder(path).nbytes for path in img_paths])
+    print(f"{'fault':<7}{'old ms':>9}{'new ms':>9}{'old peak':>10}{'new peak':>10}")
+    for fault_type in FAULTS:
+        old_ms = timer(old_tof_path, img_paths, fault_type, repeat)
+        new_ms = timer(new_tof_path, img_paths, fault_type, repeat)
+        old_peak = peak_counter(old_tof_path, img_paths, fault_type) / frame_bytes
+        new_peak = peak_counter(new_tof_path, img_paths, fault_type) / frame_bytes
+        print(
+            f"{fault_type:<7}{old_ms:>9.3f}{new_ms:>9.3f}"
+            f"{old_peak:>10.2f}{new_peak:>10.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main(
+        sys.argv[1] if len(sys.argv) > 1 else DEFAULT_FOLDER,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 10,
+    )
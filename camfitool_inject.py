@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Headless Offline FI Command For Camera FI Demo Tool
+-----------------------------------------------
+camfitool-inject runs the offline FI engine (offline_fault_injector_ui.main)
+without the interface, e.g. from cron or a batch scheduler. It does not
+import PyQt5, the interface modules or ROS; the engine is only imported
+after the arguments are parsed, so --help returns at once.
+
+The options can also be given in a JSON (or TOML, Python 3.11+) plan file
+with the option names as keys, {"ndir_name": ..., "fault": ["Gaussian"],
+"rate": 10, "workers": 4}. The command line options override the plan.
+A structured plan of fi_plan.py (with "faults") is run with all variants of
+its sweep, the command line options are not used then.
+
+The engine messages are printed to stderr and a JSON summary of the run
+(status, message, image count, faulty images, seed, elapsed time) to stdout
+or to the --summary file; a structured plan gives {"status", "runs": [...]}.
+The exit status is 0 on success, 1 on failure and 2 on wrong arguments.
+
+A run can be split across machines with --shard-index/--shard-count and a
+fixed --seed, every machine then writes only its job shard of the images.
+--merge merges the summaries of all job shards into the summary of the run.
+With --queue, the jobs go to a SQLite work queue on a shared folder instead
+(see fi_queue.py) and the other machines pull batches with --join-queue.
+
+Usage:
+    python camfitool_inject.py NDIR FDIR --fault Gaussian --rate 10
+    python camfitool_inject.py NDIR FDIR --fault Gaussian:10 Erosion:15
+    python camfitool_inject.py --plan plan.json --workers 4
+    python camfitool_inject.py --plan fi_plans/sweep.json
+    python camfitool_inject.py NDIR FDIR --fault Erosion --rate 10 --seed 5 \
+        --shard-index 0 --shard-count 4 --summary shard0.json
+    python camfitool_inject.py --merge shard*.json --summary run.json
+    python camfitool_inject.py NDIR FDIR --fault Erosion --rate 10 \
+        --queue /shared/run.sqlite --workers 4
+    python camfitool_inject.py --join-queue /shared/run.sqlite --workers 8
+"""
+
+import sys
+import json
+import argparse
+import contextlib
+
+from fi_cache import size_parser
+from fi_plan import (
+    fi_runner,
+    is_structured_plan,
+    plan_executor,
+    plan_loader,
+    plan_validator,
+    summary_merger,
+)
+
+COPY_MODES = ("copy", "hardlink", "reflink")
+EXECUTORS = ("auto", "thread", "process")
+
+
+def int_list_parser(value):
+    """Parses "1,2,4" to (1, 2, 4)."""
+    try:
+        return tuple(int(item) for item in value.split(","))
+    except ValueError:
+        raise argparse.ArgumentTypeError("comma separated integers expected: " + value)
+
+
+def argument_parser():
+    """Parser of the camfitool-inject options"""
+    parser = argparse.ArgumentParser(
+        prog="camfitool-inject", description="CamFITool headless offline FI"
+    )
+    parser.add_argument("ndir_name", nargs="?", help="Normal image folder")
+    parser.add_argument("fdir_name", nargs="?", help="Faulty image folder")
+    parser.add_argument("--plan", help="JSON/TOML file of the options")
+    parser.add_argument(
+        "--fault",
+        nargs="+",
+        help="Fault type (Gaussian, Erosion...) or a pipeline of TYPE:RATE",
+    )
+    parser.add_argument("--rate", type=int, help="Fault rate (%%)")
+    parser.add_argument(
+        "--fimp-rate", type=int, default=100, help="Faulty image rate (%%)"
+    )
+    parser.add_argument("--randomized", action="store_true")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--workers", type=int, default=1, help="Workers, 0: all cores")
+    parser.add_argument(
+        "--executor",
+        choices=EXECUTORS,
+        default="auto",
+        help="Worker threads or processes, auto: threads for OpenCV-only faults",
+    )
+    parser.add_argument("--copy-mode", choices=COPY_MODES)
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument(
+        "--stream-stages", type=int_list_parser, help="READERS,FAULTERS,WRITERS"
+    )
+    parser.add_argument("--queue-depth", type=int, default=8)
+    parser.add_argument("--manifest-dir", default="fi_manifests")
+    parser.add_argument("--no-manifest", action="store_true")
+    parser.add_argument("--resume", action="store_true")
+    parser.add_argument("--cache-dir")
+    parser.add_argument("--cache-max-size", type=size_parser, help="e.g. 500M, 10G")
+    parser.add_argument("--pack", help="Pack path of fi_pack.py")
+    parser.add_argument("--tiling", type=int_list_parser, help="TILE_SIZE,THREADS")
+    parser.add_argument("--output-codec", help="same, png[:0-9], webp, tiff, bmp")
+    parser.add_argument("--encode-threads", type=int, default=1)
+    parser.add_argument("--recursive", action="store_true")
+    parser.add_argument("--include", nargs="+", help="Globs of the image paths")
+    parser.add_argument("--exclude", nargs="+", help="Globs of the image paths")
+    parser.add_argument("--shard-input", action="store_true")
+    parser.add_argument("--shard-size", type=int, help="Output tar shard size")
+    parser.add_argument(
+        "--shard-index", type=int, default=0, help="Job shard of this machine"
+    )
+    parser.add_argument(
+        "--shard-count", type=int, default=1, help="Machines sharing the run"
+    )
+    parser.add_argument(
+        "--merge", nargs="+", metavar="SUMMARY", help="Merges job shard summaries"
+    )
+    parser.add_argument("--queue", help="Runs the jobs through a SQLite work queue")
+    parser.add_argument(
+        "--join-queue", metavar="QUEUE", help="Runs workers of an existing queue"
+    )
+    parser.add_argument(
+        "--lease-time", type=float, default=60.0, help="Queue lease time (s)"
+    )
+    parser.add_argument("--summary", help="JSON summary file (default: stdout)")
+    return parser
+
+
+def argument_reader(parser, argv=None):
+    """
+    Parses the arguments, the options of a --plan file are the defaults.
+    Returns (arguments, structured plan or None).
+    """
+    args = parser.parse_args(argv)
+    if args.merge or args.join_queue:
+        return args, None
+    if args.plan is not None:
+        try:
+            plan = plan_loader(args.plan)
+        except (OSError, ValueError) as error_msg:
+            parser.error("plan cannot be read: " + str(error_msg))
+        if is_structured_plan(plan):
+            errors = plan_validator(plan)
+            if errors:
+                parser.error("invalid plan: " + "; ".join(errors))
+            return args, plan
+        plan = {key.replace("-", "_"): value for key, value in plan.items()}
+        unknown_keys = sorted(set(plan) - set(vars(args)))
+        if unknown_keys:
+            parser.error("unknown plan options: " + ", ".join(unknown_keys))
+        for key in ("stream_stages", "tiling"):
+            if isinstance(plan.get(key), str):
+                plan[key] = int_list_parser(plan[key])
+        if isinstance(plan.get("fault"), str):
+            plan["fault"] = [plan["fault"]]
+        parser.set_defaults(**plan)
+        args = parser.parse_args(argv)
+    if args.ndir_name is None or args.fdir_name is None:
+        parser.error("the normal and the faulty image folders are required")
+    if not args.fault:
+        parser.error("--fault is required")
+    if not 0 <= args.shard_index < args.shard_count:
+        parser.error("--shard-index must be in 0-" + str(args.shard_count - 1))
+    if args.shard_count > 1 and args.seed is None and not args.resume:
+        parser.error("--seed is required with --shard-count")
+    return args, None
+
+
+def fault_parser(parser, faults, rate):
+    """
+    (fault type, fault rate) of the engine: one fault with --rate, or a
+    pipeline [(fault type, rate), ...] of TYPE:RATE faults.
+    """
+    if len(faults) == 1 and ":" not in faults[0]:
+        if rate is None:
+            parser.error("--rate is required")
+        return faults[0], rate
+    fault_pipeline = []
+    for fault in faults:
+        fault_type, _, fault_rate = fault.partition(":")
+        if not fault_rate and rate is None:
+            parser.error("fault rate is required: " + fault)
+        try:
+            fault_pipeline.append((fault_type, int(fault_rate or rate)))
+        except ValueError:
+            parser.error("fault rate must be an integer: " + fault)
+    return fault_pipeline, None
+
+
+def summary_writer(summary, summary_path=None):
+    """Writes the JSON summary to summary_path or stdout."""
+    if summary_path is None:
+        json.dump(summary, sys.stdout)
+        sys.stdout.write("\n")
+        sys.stdout.flush()
+    else:
+        with open(summary_path, "w", encoding="utf-8") as summary_file:
+            json.dump(summary, summary_file, indent=2)
+
+
+def main(argv=None):
+    """camfitool-inject main function, returns the exit status."""
+    parser = argument_parser()
+    args, plan = argument_reader(parser, argv)
+
+    if args.merge:
+        try:
+            summaries = [plan_loader(summary_path) for summary_path in args.merge]
+            summary = summary_merger(summaries)
+        except (OSError, ValueError) as error_msg:
+            parser.error("summaries cannot be merged: " + str(error_msg))
+        summary_writer(summary, args.summary)
+        return 0 if summary["status"] == "ok" else 1
+
+    if args.join_queue:
+        from offline_fault_injector_ui import queue_worker_runner
+
+        with contextlib.redirect_stdout(sys.stderr):
+            batch_count = queue_worker_runner(
+                args.join_queue, args.workers or None, args.lease_time, args.executor
+            )
+        from fi_queue import FIQueue
+
+        failed_count = FIQueue(args.join_queue).progress().get("failed", 0)
+        summary_writer(
+            {
+                "status": "error" if failed_count else "ok",
+                "batch_count": batch_count,
+                "failed_batch_count": failed_count,
+            },
+            args.summary,
+        )
+        return 1 if failed_count else 0
+
+    if plan is not None:
+        # Engine messages go to stderr, stdout is kept for the summary.
+        with contextlib.redirect_stdout(sys.stderr):
+            summaries = plan_executor(plan)
+        failed = any(summary["status"] != "ok" for summary in summaries)
+        summary_writer(
+            {"status": "error" if failed else "ok", "runs": summaries}, args.summary
+        )
+        return 1 if failed else 0
+
+    fault_type, fault_rate = fault_parser(parser, args.fault, args.rate)
+    with contextlib.redirect_stdout(sys.stderr):
+        summary = fi_runner(
+            dict(
+                ndir_name=args.ndir_name,
+                fdir_name=args.fdir_name,
+                fault_type=fault_type,
+                fault_rate=fault_rate,
+                randomized=args.randomized,
+                fimp_rate=args.fimp_rate,
+                last_fi_name_list=None,
+                workers=args.workers or None,
+                copy_mode=args.copy_mode,
+                batch_size=args.batch_size,
+                stream_stages=args.stream_stages,
+                queue_depth=args.queue_depth,
+                seed=args.seed,
+                manifest_dir=None if args.no_manifest else args.manifest_dir,
+                resume=args.resume,
+                cache_dir=args.cache_dir,
+                cache_max_size=args.cache_max_size,
+                pack_path=args.pack,
+                tiling=args.tiling,
+                output_codec=args.output_codec,
+                encode_threads=args.encode_threads,
+                recursive=args.recursive,
+                include=args.include,
+                exclude=args.exclude,
+                shard_input=args.shard_input,
+                shard_size=args.shard_size,
+                shard_index=args.shard_index,
+                shard_count=args.shard_count,
+                work_queue=args.queue,
+                lease_time=args.lease_time,
+                executor=args.executor,
+            )
+        )
+    summary_writer(summary, args.summary)
+    return 0 if summary["status"] == "ok" else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
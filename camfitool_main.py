@@ -22,6 +22,8 @@ from PyQt5 import QtWidgets
 import ui_interface as Ui
 
 from offline_fault_injector_ui import main as ofi
+from fi_plan import plan_builder, plan_executor, plan_loader, plan_saver
+from fi_discovery import image_scanner
 from realtime_fault_injector_ui import RealtimeFaultInjector as rfi
 
 import extras as ext
@@ -365,31 +367,18 @@ class MainWindow(QtWidgets.QMainWindow):
 
             self.apply_fault_button_func(True)
 
-            # This line will be removed when the plan is selected from the
-            # saved plan list and the application is added.
-            plan_from_list = False
-            if plan_from_list:
-                try:
-                    self.ui_int.info_text.clear()
-                    with open(
-                        str(ext.get_current_workspace()) + "/fi_plans/" + self.fi_plan,
-                        "r",
-                        encoding="utf-8",
-                    ) as fi_plan_file:
-                        self.ui_int.info_text.setText(
-                            "FI Plan Applying ...\n-----------------\n"
-                            + fi_plan_file.read()
-                        )
-                except IndexError:
+            # With Apply FI Plan checked, the structured plan (.json/.toml, see
+            # fi_plan.py) selected in the FI Plans list is applied with all
+            # variants of its sweep instead of the Camera Fault Configuration.
+            if self.ui_int.apply_fi_plan_check.isChecked():
+                plan_path = self.selected_fi_plan_path()
+                if plan_path is None:
                     self.pop_up_message(
-                        'Please choose one fault injection plan from "FI Plans"!'
+                        'Please choose one .json/.toml plan from "FI Plans" or '
+                        + 'uncheck "Apply FI Plan".'
                     )
-                    ext.error_log_creator(IndexError)
                 else:
-                    if self.ui_int.randomize_check.isChecked():
-                        print("randomized")
-                    else:
-                        print("unrandomized")
+                    self.fi_plan_applier(plan_path)
             else:
                 #### APPLY FAULT SECTION ############
                 self.info_temp()
@@ -424,7 +413,7 @@ class MainWindow(QtWidgets.QMainWindow):
                         resimlerin isimlerini icerir.
                         """
                         if self.repeated_process_lock is False:
-                            resource, count, fi_image_name_list = ofi(
+                            resource, count, fi_image_name_list, selection_seed = ofi(
                                 self.normal_image_folder,
                                 self.fi_image_folder,
                                 self.fault_type,
@@ -452,7 +441,7 @@ class MainWindow(QtWidgets.QMainWindow):
                                 self.repeated_process_lock = False
                             return None
                     else:
-                        resource, count, fi_image_name_list = ofi(
+                        resource, count, fi_image_name_list, selection_seed = ofi(
                             self.normal_image_folder,
                             self.fi_image_folder,
                             self.fault_type,
@@ -479,7 +468,7 @@ class MainWindow(QtWidgets.QMainWindow):
 
                     # For logging faulty images name list
                     self.faulty_image_list_saver(
-                        self.fi_image_folder, fi_image_name_list
+                        self.fi_image_folder, fi_image_name_list, selection_seed
                     )
 
                 except IndexError:
@@ -688,14 +677,32 @@ class MainWindow(QtWidgets.QMainWindow):
     def save_fi_plan(self):
         """
         It is the function where the Save FI Plan button is defined. Saves the fault
-        properties defined in the Camera Fault Config menu to a selected .txt file.
+        properties defined in the Camera Fault Config menu to a selected file.
         After this registration process, it publishes the confirmation message in the
-        Info tab. (The registration system made in this section will be arranged with
-        a .json extension later.)
+        Info tab. Offline plans are saved as structured .json plans (see fi_plan.py),
+        which can be applied from the FI Plans list; real-time plans as .txt files.
         """
         self.info_temp()
 
         try:
+            if self.fi_type == "Offline":
+                save_file = Ui.QtWidgets.QFileDialog.getSaveFileName(
+                    None,
+                    "Save FI Plan",
+                    str(ext.get_current_workspace()) + "/fi_plans/fi_plan.json",
+                    "FI Plans (*.json)",
+                )
+                if save_file[0]:
+                    fi_plan = self.offline_fi_plan()
+                    fi_plan["created"] = str(datetime.datetime.now().ctime())
+                    plan_saver(fi_plan, save_file[0])
+                self.ui_int.info_text.setText(
+                    "FI Plan Saved! To apply it, choose it from the 'FI Plans' "
+                    + "Section and click 'Apply Fault' button!"
+                )
+                self.update_fi_list_func()
+                return
+
             # S_File will get the directory path and extension.
             save_file = Ui.QtWidgets.QFileDialog.getSaveFileName(
                 None,
@@ -722,12 +729,105 @@ class MainWindow(QtWidgets.QMainWindow):
                 + "'Show FIP Details' button!"
             )
 
-        except AttributeError:
+        except (AttributeError, TypeError) as error_msg:
             self.pop_up_message("Fault Rate Missing!")
-            ext.error_log_creator(AttributeError)
+            ext.error_log_creator(error_msg)
+        except IndexError:
+            self.pop_up_message(
+                "Please choose one Normal and one "
+                + "Fault image folders from Folder Selection Section on the left side."
+            )
+            ext.error_log_creator(IndexError)
 
         self.update_fi_list_func()
 
+    def offline_fi_plan(self):
+        """
+        Structured FI plan (fi_plan.py) of the offline fault configuration and
+        the selected Normal and FI image folders.
+        """
+        fi_image_folder = (
+            str(ext.get_current_workspace())
+            + "/images/fault_image_folders/"
+            + str(self.ui_int.fi_file_tree.selectedIndexes()[0].data())
+            + "/"
+        )
+        return plan_builder(
+            self.normal_image_folder,
+            fi_image_folder,
+            self.fault_type,
+            int(self.fault_rate),
+            int(self.fault_imp_rate),
+            self.ui_int.randomize_check.isChecked(),
+        )
+
+    def fi_plan_applier(self, plan_path):
+        """
+        Applies a structured plan with all variants of its sweep and saves the
+        faulty image list of every variant. The lists are built from the
+        normal image folder of the plan, not from the folder selected in the
+        interface.
+        """
+        try:
+            self.ui_int.info_text.clear()
+            fi_plan = plan_loader(plan_path)
+            summaries = plan_executor(fi_plan)
+            plan_input = fi_plan.get("input", {})
+            normal_image_lists = {}
+            plan_info = "FI Plan Applied!\n-----------------\n"
+            for summary in summaries:
+                if summary["status"] != "ok":
+                    plan_info += summary["variant"] + ": " + summary["error"] + "\n"
+                    ext.error_log_creator(summary["error"])
+                    continue
+                plan_info += (
+                    summary["variant"]
+                    + ": "
+                    + str(summary["faulty_count"])
+                    + "/"
+                    + str(summary["image_count"])
+                    + " faulty images\n"
+                )
+                ndir_name = summary["ndir_name"]
+                if ndir_name not in normal_image_lists:
+                    normal_image_lists[ndir_name] = list(
+                        image_scanner(
+                            os.path.join(ndir_name, ""),
+                            plan_input.get("recursive", False),
+                            plan_input.get("include"),
+                            plan_input.get("exclude"),
+                        )
+                    )
+                # For logging faulty images name list
+                self.faulty_image_list_saver(
+                    summary["fdir_name"],
+                    summary["faulty_images"],
+                    summary["seed"],
+                    normal_image_lists[ndir_name],
+                )
+            self.ui_int.info_text.setPlainText(plan_info)
+        except (OSError, ValueError) as error_msg:
+            self.pop_up_message("FI plan cannot be applied: " + str(error_msg))
+            ext.error_log_creator(error_msg)
+        except Exception as error_msg:
+            self.pop_up_message(
+                "Something wrong! You should look logs file for details."
+            )
+            ext.error_log_creator(error_msg)
+
+    def selected_fi_plan_path(self):
+        """
+        Path of the structured plan (.json/.toml) selected in the FI Plans list,
+        None when no structured plan is selected.
+        """
+        selected_plans = self.ui_int.fi_plan_tree.selectedIndexes()
+        if not selected_plans:
+            return None
+        plan_name = str(selected_plans[0].data())
+        if not plan_name.lower().endswith((".json", ".toml")):
+            return None
+        return str(ext.get_current_workspace()) + "/fi_plans/" + plan_name
+
     @classmethod
     def pop_up_message(cls, msg):
         """
@@ -898,7 +998,13 @@ class MainWindow(QtWidgets.QMainWindow):
         self.ui_int.ros_cam_fi_freq_text.setFontItalic(False)
         self.ui_int.ros_cam_fi_freq_text.setFontPointSize(11.0)
 
-    def faulty_image_list_saver(self, fi_image_folder, fi_image_list):
+    def faulty_image_list_saver(
+        self,
+        fi_image_folder,
+        fi_image_list,
+        selection_seed=None,
+        normal_image_list=None,
+    ):
         date_info = datetime.datetime.now()
         curr_time = (
             str(date_info.day)
@@ -915,16 +1021,22 @@ class MainWindow(QtWidgets.QMainWindow):
         ) as fi_list_file:
             fi_list_file.write("Created: " + str(date_info))
             fi_list_file.write("\nFault Value: ")
-            total_normal_image = len(self.normal_image_list)
+            # normal_image_list: images of the run, the selected folder by default
+            if normal_image_list is None:
+                normal_image_list = self.normal_image_list
+            total_normal_image = len(normal_image_list)
             fault_imp_value = len(fi_image_list)
             fi_list_file.write(str(fault_imp_value) + "/" + str(total_normal_image))
             fi_list_file.write("\nFaulty Image Name List: \n")
             fi_list_file.write(str(fi_image_list))
             fi_list_file.write("\nRemain Normal Image Name List: \n")
             remain_norm_img_list = ext.list_substractor(
-                self.normal_image_list, fi_image_list
+                normal_image_list, fi_image_list
             )
             fi_list_file.write(str(remain_norm_img_list))
+            # The seed of the image selection, the same selection can be
+            # repeated with it.
+            fi_list_file.write("\nSelection Seed: " + str(selection_seed))
         # Saving last fi logfile and fi image folder name for multipartial fi process
         self.last_fi_image_list = fi_image_list
         self.last_fi_image_folder = fi_image_folder
@@ -5,12 +5,23 @@ Offline Fault Injection Python Class For Camera FI Demo Tool
 """
 
 import os
-import sys
+import io
+import tempfile
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
 import cv2
-from cv_bridge import CvBridge
 import numpy as np
 from PIL import Image
-from imgaug import augmenters as iaa
+import noise_kernels as nk
+import morphology_kernels as mk
+
+# PIL's RGB -> L conversion in 16-bit fixed point:
+# L = (R * 19595 + G * 38470 + B * 7471 + 0x8000) >> 16
+L_WEIGHTS = (19595, 38470, 7471)
+# Pixels per uint32 scratch block of the grayscale conversion
+L_BLOCK_PIXELS = 1 << 12
+# PIL image modes that OpenCV decodes to the same array (after BGR -> RGB)
+CV2_TOF_MODES = {"L", "RGB", "RGBA"}
 
 
 class OfflineImageFault:
@@ -20,8 +31,19 @@ class OfflineImageFault:
         - fdir_name: Faulty image directory (output file) name
         - img_name: Image name
         - img_format: Image format (.bmp, .png etc.)
-        - fault_type: Choosing fault type
+        - fault_type: Choosing fault type, or an ordered fault pipeline as a
+          list of (fault_type, fault_rate) pairs
         - fault_rate: Fault rate (%)
+        - image_pack: Optional fi_pack.FIPack of the normal image folder, the
+          packed images are read instead of decoding the image files
+        - tiling: Optional (tile size, thread count), the fault is applied tile
+          by tile on several threads (see tiled_fault), the memory of very large
+          images is bounded by the tiles when they are read from image_pack
+        - output_codec: Optional (output format, cv2.imwrite parameters) of the
+          faulty image (see image_codecs.py), the input format when None or
+          when the output format is None
+        - rng: Optional numpy Generator of the noise faults (see
+          noise_kernels.image_rng), OpenCV's RNG is used when None
 
     ### Image Faults:
         - Salt&Pepper -> salt_pepper()
@@ -37,7 +59,17 @@ class OfflineImageFault:
     """
 
     def __init__(
-        self, ndir_name, fdir_name, img_name, img_format, fault_type, fault_rate
+        self,
+        ndir_name,
+        fdir_name,
+        img_name,
+        img_format,
+        fault_type,
+        fault_rate,
+        image_pack=None,
+        tiling=None,
+        output_codec=None,
+        rng=None,
     ):
 
         self.ndir_name = ndir_name
@@ -46,13 +78,20 @@ class OfflineImageFault:
         self.img_format = img_format
         self.fault_type = fault_type
         self.fault_rate = fault_rate
-        self.bridge = CvBridge()
+        self.image_pack = image_pack
+        self.tiling = tiling
+        self.output_codec = output_codec
+        self.rng = rng
 
     def main(self):
-        """Main Function"""
+        """Main Function. Returns True when the faulty image is written."""
+        if self.tiling is not None:
+            return self.tiled_image_fault()
+        if isinstance(self.fault_type, (list, tuple)):
+            return self.pipeline_image_fault()
         if self.fault_type == "s" or self.fault_type == "g" or self.fault_type == "p":
-            self.tof_image_fault()
-        elif (
+            return self.tof_image_fault()
+        if (
             self.fault_type == "o"
             or self.fault_type == "c"
             or self.fault_type == "e"
@@ -61,9 +100,9 @@ class OfflineImageFault:
             or self.fault_type == "m"
             or self.fault_type == "par"
         ):
-            self.rgb_image_fault()
-        else:
-            print("Error")
+            return self.rgb_image_fault()
+        print("Error")
+        return False
 
     def tof_image_fault(self):
         """
@@ -73,29 +112,33 @@ class OfflineImageFault:
         - Poisson -> poisson()
         """
         try:
-            image_file = Image.open(self.ndir_name + self.img_name + self.img_format)
-            im_arr = np.asarray(image_file)
+            im_arr = self.tof_image_reader()
+            # The decoded buffer is faulted in place (packed images are read-only).
+            out = im_arr if im_arr.flags.writeable else None
 
             if self.fault_type != "nf":
+                # Native noise kernels (noise_kernels.py) are used instead of
+                # building a new imgaug augmenter for every image.
                 if self.fault_type == "s":
-                    aug_img = self.salt_pepper(self.fault_rate)
+                    im_arr = nk.salt_pepper(im_arr, self.fault_rate, self.rng, out=out)
                 elif self.fault_type == "g":
-                    aug_img = self.gaussian(self.fault_rate)
+                    im_arr = nk.gaussian_noise(
+                        im_arr, self.fault_rate * 255, self.rng, out=out
+                    )
                 elif self.fault_type == "p":
-                    aug_img = self.poisson(self.fault_rate)
+                    im_arr = nk.poisson_noise(
+                        im_arr, float(self.fault_rate * 100), self.rng, out=out
+                    )
                 else:
-                    print("This fault cannot be found. Try again...")
-                    sys.exit()
+                    # Raised instead of sys.exit(), an unknown fault must not
+                    # stop the whole offline FI run.
+                    raise ValueError("This fault cannot be found. Try again...")
 
-                im_arr = aug_img.augment_image(im_arr)
-            image_file = Image.fromarray(im_arr).convert("L")
-            image_file = np.array(image_file)
-            image_name = str(self.img_name + self.img_format)
-            # saving faulty tof image
-            cv2.imwrite(os.path.join(self.fdir_name, image_name), image_file)
+            return self.tof_image_writer(im_arr)
 
         except Exception as error_msg:
             print(error_msg)
+            return False
 
     def rgb_image_fault(self):
         """
@@ -105,12 +148,9 @@ class OfflineImageFault:
             - Gradient -> gradient()
             - Partialloss -> partialloss()
         """
-        # Normally, since the fault rate comes as a percentage (it was arranged for TOF),
-        # it is provided to bring that value to the range of 0-20.
-        fi_rate = int(self.fault_rate * 20)
-        kernel = np.ones((fi_rate, fi_rate), np.uint8)
+        kernel = self.fault_kernel(self.fault_rate)
         try:
-            image_file = cv2.imread(self.ndir_name + self.img_name + self.img_format)
+            image_file = self.rgb_image_reader()
 
             if self.fault_type != "nf":
                 if self.fault_type == "e":
@@ -122,38 +162,464 @@ class OfflineImageFault:
                 elif self.fault_type == "par":
                     image_file = self.partialloss(image_file, kernel)
                 else:
-                    print("This fault cannot be found. Try again...")
-                    sys.exit()
+                    raise ValueError("This fault cannot be found. Try again...")
 
-            image_name = str(self.img_name + self.img_format)
-            # saving faulty tof image
-            cv2.imwrite(os.path.join(self.fdir_name, image_name), image_file)
+            return self.rgb_image_writer(image_file)
+
+        except Exception as error_msg:
+            print(error_msg)
+            return False
+
+    def pipeline_image_fault(self):
+        """
+        Fault Pipeline: applies the ordered faults of the pipeline in memory,
+        with one read and one write per image.
+        """
+        tof_fault = self.tof_fault_check(self.fault_type)
+        try:
+            if tof_fault:
+                image_file = self.tof_image_reader()
+            else:
+                image_file = self.rgb_image_reader()
+
+            image_file = self.pipeline_fault(image_file, self.fault_type, self.rng)
+
+            if tof_fault:
+                return self.tof_image_writer(image_file)
+            return self.rgb_image_writer(image_file)
+
+        except Exception as error_msg:
+            print(error_msg)
+            return False
+
+    def tiled_image_fault(self):
+        """
+        Tiled Faults: applies the fault (or the fault pipeline) tile by tile,
+        see tiled_fault.
+        """
+        tof_fault = self.tof_fault_check(self.fault_type)
+        tile_size, tile_threads = self.tiling
+        try:
+            with contextlib.ExitStack() as buffer_stack:
+
+                def buffer_creator(shape, dtype):
+                    # Image-sized buffers are memory maps of temporary files
+                    # next to the outputs, only the tiles are in memory.
+                    temp_file = buffer_stack.enter_context(
+                        tempfile.TemporaryFile(dir=self.fdir_name)
+                    )
+                    return np.memmap(temp_file, dtype, "w+", shape=shape)
+
+                if tof_fault:
+                    image_file = self.tof_image_reader()
+                else:
+                    image_file = self.rgb_image_reader()
+
+                image_file = self.tiled_fault(
+                    image_file,
+                    self.fault_type,
+                    self.fault_rate,
+                    tile_size,
+                    tile_threads,
+                    self.rng,
+                    buffer_creator,
+                )
+
+                if tof_fault:
+                    if image_file.ndim == 3:
+                        image_file = self.gray_converter(
+                            image_file,
+                            buffer_creator(image_file.shape[:2], np.uint8),
+                        )
+                    return self.image_encoder(image_file)
+                return self.rgb_image_writer(image_file)
 
         except Exception as error_msg:
             print(error_msg)
+            return False
+
+    @classmethod
+    def tof_fault_check(cls, fault_type):
+        """
+        True when the fault (all faults of a pipeline) is a TOF fault, the image
+        is then read and written with the TOF reader/writer.
+        """
+        if isinstance(fault_type, (list, tuple)):
+            return all(pipe_type in {"s", "g", "p"} for pipe_type, _ in fault_type)
+        return fault_type in {"s", "g", "p"}
+
+    @classmethod
+    def noise_fault_check(cls, fault_type):
+        """True when the fault (any fault of a pipeline) draws random noise."""
+        if isinstance(fault_type, (list, tuple)):
+            return any(pipe_type in {"s", "g", "p"} for pipe_type, _ in fault_type)
+        return fault_type in {"s", "g", "p"}
+
+    @classmethod
+    def fault_kernel(cls, fault_rate):
+        """Morphology kernel of the RGB faults."""
+        # Normally, since the fault rate comes as a percentage (it was arranged for TOF),
+        # it is provided to bring that value to the range of 0-20.
+        fi_rate = int(fault_rate * 20)
+        return np.ones((fi_rate, fi_rate), np.uint8)
+
+    @classmethod
+    def morphology_halo(cls, fault_type, fault_rate):
+        """
+        Number of neighbour pixels a fault reads on every side of a pixel (0 for
+        the noise faults). Erosion/dilation reach one kernel per iteration.
+        """
+        if fault_type not in {"e", "d", "gr"}:
+            return 0
+        kernel = cls.fault_kernel(fault_rate)
+        kernel_size = max(kernel.shape) if kernel.size else 3  # cv2 default: 3x3
+        iterations = 1 if fault_type == "gr" else 5
+        return iterations * kernel_size
+
+    @classmethod
+    def image_tiles(cls, height, width, tile_size):
+        """(y0, y1, x0, x1) bounds of the tiles of an image, row by row."""
+        return [
+            (y0, min(y0 + tile_size, height), x0, min(x0 + tile_size, width))
+            for y0 in range(0, height, tile_size)
+            for x0 in range(0, width, tile_size)
+        ]
+
+    @classmethod
+    def tiled_fault(
+        cls,
+        image,
+        fault_type,
+        fault_rate,
+        tile_size=1024,
+        threads=1,
+        rng=None,
+        buffer_creator=None,
+    ):
+        """
+        Applies a fault (or a fault pipeline) to an image tile by tile and
+        returns the faulty image. Every morphology tile is read with a halo of
+        morphology_halo pixels, so erosion, dilation and gradient are identical
+        to the fault of the whole image. Tiles run on `threads` threads.
+
+        The image is only read tile by tile, and the faulty image and the
+        buffer of a pipeline stage are created by buffer_creator(shape, dtype)
+        (np.empty when None). With a memory-mapped image (fi_pack) and
+        memory-mapped buffers (see tiled_image_fault), the peak memory is
+        bounded by the tiles of the running threads, not by the image size.
+        With a numpy Generator rng, every tile gets its own noise stream
+        spawned from it, so the result does not depend on the thread count
+        (but on the tile size).
+        """
+        if buffer_creator is None:
+            buffer_creator = np.empty
+        if isinstance(fault_type, (list, tuple)):
+            fault_pipeline = fault_type
+        else:
+            fault_pipeline = [(fault_type, fault_rate)]
+        height, width = image.shape[:2]
+        tiles = cls.image_tiles(height, width, tile_size)
+        source, spare = image, None
+
+        for stage_type, stage_rate in fault_pipeline:
+            halo = cls.morphology_halo(stage_type, stage_rate)
+            if spare is None:
+                spare = buffer_creator(image.shape, image.dtype)
+            target = spare
+            tile_rngs = [None] * len(tiles)
+            if rng is not None:
+                stage_seed = np.random.SeedSequence(int(rng.integers(2**63)))
+                tile_rngs = [
+                    np.random.default_rng(tile_seed)
+                    for tile_seed in stage_seed.spawn(len(tiles))
+                ]
+
+            def tile_fault(tile_index):
+                y0, y1, x0, x1 = tiles[tile_index]
+                hy0, hx0 = max(0, y0 - halo), max(0, x0 - halo)
+                tile = source[hy0 : min(height, y1 + halo), hx0 : min(width, x1 + halo)]
+                tile = cls.pipeline_fault(
+                    tile, [(stage_type, stage_rate)], tile_rngs[tile_index]
+                )
+                target[y0:y1, x0:x1] = tile[y0 - hy0 : y1 - hy0, x0 - hx0 : x1 - hx0]
+
+            if threads <= 1:
+                for tile_index in range(len(tiles)):
+                    tile_fault(tile_index)
+            else:
+                with ThreadPoolExecutor(max_workers=threads) as executor:
+                    list(executor.map(tile_fault, range(len(tiles))))
+
+            # The input image is never written, the next stage writes to the
+            # buffer of the previous stage's source.
+            spare = source if source is not image else None
+            source = target
+
+        if source is image:
+            # An empty pipeline, the faulty image is a copy of the image.
+            target = buffer_creator(image.shape, image.dtype)
+            target[...] = image
+            return target
+        return source
+
+    @classmethod
+    def image_fault(cls, image, fault_type, fault_rate, rng=None):
+        """
+        Applies a fault (or a fault pipeline) to an image in memory and returns
+        the faulty image, the input image is not changed.
+        """
+        if isinstance(fault_type, (list, tuple)):
+            return cls.pipeline_fault(image, fault_type, rng)
+        return cls.pipeline_fault(image, [(fault_type, fault_rate)], rng)
+
+    @classmethod
+    def pipeline_fault(cls, image, fault_pipeline, rng=None):
+        """
+        Applies an ordered fault pipeline [(fault_type, fault_rate), ...] to one
+        image in memory. Noise faults work in place on the image buffer and
+        morphology faults swap between the image buffer and one spare buffer,
+        so the intermediate results do not allocate new images.
+        """
+        image = np.array(image)  # writable working buffer
+        spare = None
+
+        for fault_type, fault_rate in fault_pipeline:
+            if fault_type == "s":
+                nk.salt_pepper(image, fault_rate, rng, out=image)
+            elif fault_type == "g":
+                nk.gaussian_noise(image, fault_rate * 255, rng, out=image)
+            elif fault_type == "p":
+                nk.poisson_noise(image, float(fault_rate * 100), rng, out=image)
+            elif fault_type in {"e", "d", "gr"}:
+                if spare is None:
+                    spare = np.empty_like(image)
+                kernel_size = cls.fault_kernel(fault_rate).shape[0]
+                if fault_type == "gr":
+                    mk.rect_gradient(image, kernel_size, dst=spare)
+                else:
+                    mk.rect_morphology(image, fault_type, kernel_size, 5, dst=spare)
+                image, spare = spare, image
+            else:
+                raise ValueError("This fault cannot be found: " + str(fault_type))
+
+        return image
+
+    def tof_image_reader(self):
+        """Reads the normal image for the TOF faults."""
+        if self.image_pack is not None:
+            image_file = self.image_pack.image(self.img_name, "tof")
+            if image_file is not None:
+                return image_file
+        return self.tof_decoder(self.ndir_name + self.img_name + self.img_format)
+
+    def tof_image_writer(self, im_arr):
+        """Saves the (faulty) TOF image as a grayscale image, True on success."""
+        # saving faulty tof image
+        return self.image_encoder(self.gray_converter(im_arr))
+
+    @classmethod
+    def tof_decoder(cls, img_path):
+        """
+        Decodes a TOF image to the array of np.asarray(PIL.Image.open()) with
+        one OpenCV decode into a writable buffer. PIL only reads the header to
+        find the image mode; other modes (palette, 16-bit...) are decoded by PIL.
+        img_path can also be the bytes of an encoded image (fi_shards.py).
+        """
+        with Image.open(cls.pil_source(img_path)) as image_file:
+            mode = image_file.mode
+            if mode not in CV2_TOF_MODES:
+                return np.asarray(image_file)
+        image = cls.cv2_decoder(img_path, cv2.IMREAD_UNCHANGED)
+        if image is None or image.dtype != np.uint8:
+            return np.asarray(Image.open(cls.pil_source(img_path)))
+        if mode == "RGB" and image.ndim == 3 and image.shape[2] == 3:
+            cv2.cvtColor(image, cv2.COLOR_BGR2RGB, dst=image)
+        elif mode == "RGBA" and image.ndim == 3 and image.shape[2] == 4:
+            cv2.cvtColor(image, cv2.COLOR_BGRA2RGBA, dst=image)
+        elif not (mode == "L" and image.ndim == 2):
+            return np.asarray(Image.open(cls.pil_source(img_path)))
+        return image
+
+    @classmethod
+    def pil_source(cls, img_path):
+        """File path or in-memory file of an image path or encoded bytes."""
+        if isinstance(img_path, (bytes, bytearray)):
+            return io.BytesIO(img_path)
+        return img_path
+
+    @classmethod
+    def cv2_decoder(cls, img_path, flags=cv2.IMREAD_COLOR):
+        """cv2.imread of an image path or cv2.imdecode of encoded bytes."""
+        if isinstance(img_path, (bytes, bytearray)):
+            return cv2.imdecode(np.frombuffer(img_path, np.uint8), flags)
+        return cv2.imread(img_path, flags)
+
+    @classmethod
+    def gray_converter(cls, im_arr, out=None):
+        """
+        Same result as np.array(Image.fromarray(im_arr).convert("L")). uint8
+        RGB(A) images are converted with PIL's fixed-point formula into one
+        output buffer, grayscale uint8 images are written as they are.
+        (cv2.cvtColor rounds with other weights, it differs from PIL by one
+        gray level on some pixels.)
+        """
+        if im_arr.dtype != np.uint8 or not (
+            im_arr.ndim == 2 or (im_arr.ndim == 3 and im_arr.shape[2] in {3, 4})
+        ):
+            return np.array(Image.fromarray(im_arr).convert("L"))
+        if im_arr.ndim == 2:
+            return im_arr
+        height, width = im_arr.shape[:2]
+        if out is None:
+            out = np.empty((height, width), np.uint8)
+        # Blocks of rows summed in two uint32 scratch buffers that are reused
+        # by every block, the sums are below 2**24.
+        block_rows = max(1, L_BLOCK_PIXELS // width)
+        luma_block = np.empty((min(block_rows, height), width), np.uint32)
+        term_block = np.empty_like(luma_block)
+        for row in range(0, height, block_rows):
+            rows = im_arr[row : row + block_rows]
+            luma = luma_block[: rows.shape[0]]
+            term = term_block[: rows.shape[0]]
+            np.multiply(rows[:, :, 0], L_WEIGHTS[0], out=luma, dtype=np.uint32)
+            np.multiply(rows[:, :, 1], L_WEIGHTS[1], out=term, dtype=np.uint32)
+            luma += term
+            np.multiply(rows[:, :, 2], L_WEIGHTS[2], out=term, dtype=np.uint32)
+            luma += term
+            luma += 0x8000
+            luma >>= 16
+            np.copyto(out[row : row + block_rows], luma, casting="unsafe")
+        return out
+
+    def rgb_image_reader(self):
+        """Reads the normal image for the RGB faults."""
+        if self.image_pack is not None:
+            image_file = self.image_pack.image(self.img_name, "rgb")
+            if image_file is not None:
+                return image_file
+        image_file = cv2.imread(self.ndir_name + self.img_name + self.img_format)
+        if image_file is None:
+            raise IOError("Image cannot be read: " + self.img_name + self.img_format)
+        return image_file
+
+    def rgb_image_writer(self, image_file):
+        """Saves the (faulty) RGB image, True on success."""
+        # saving faulty rgb image
+        return self.image_encoder(image_file)
+
+    def image_encoder(self, image_file):
+        """Encodes and saves an image with the output codec, True on success."""
+        if self.output_codec is None:
+            image_name = str(self.img_name + self.img_format)
+            return cv2.imwrite(os.path.join(self.fdir_name, image_name), image_file)
+        out_format, codec_params = self.output_codec
+        image_name = str(self.img_name + (out_format or self.img_format))
+        return cv2.imwrite(
+            os.path.join(self.fdir_name, image_name), image_file, codec_params
+        )
+
+    ### Batch Faults ###
+    @classmethod
+    def batch_fault(cls, images, fault_type, fault_rate, rngs=None):
+        """
+        Applies one fault to a batch of same-shape images in one vectorized call.
+        images is an (N,H,W[,C]) array or a list of N same-shape arrays, rngs an
+        optional list of N numpy Generators (one noise stream per image). Returns
+        the faulty images as an (N,H,W[,C]) array. fault_type can also be a fault
+        pipeline, fault_rate is not used then.
+        """
+        batch = np.stack(images) if isinstance(images, (list, tuple)) else images
+        if isinstance(fault_type, (list, tuple)):
+            for pipe_type, pipe_rate in fault_type:
+                batch = cls.batch_fault(batch, pipe_type, pipe_rate, rngs)
+            return batch
+
+        batch_shape = batch.shape
+        # Grayscale images get a channel axis, the kernels expect (N,H,W,C).
+        if batch.ndim == 3:
+            batch = batch[..., np.newaxis]
+
+        if fault_type == "s":
+            batch = nk.salt_pepper(batch, fault_rate, rngs)
+        elif fault_type == "g":
+            batch = nk.gaussian_noise(batch, fault_rate * 255, rngs)
+        elif fault_type == "p":
+            batch = nk.poisson_noise(batch, float(fault_rate * 100), rngs)
+        elif fault_type in {"e", "d", "gr"}:
+            kernel = cls.fault_kernel(fault_rate)
+            batch = cls.stacked_morphology(batch, fault_type, kernel)
+        else:
+            raise ValueError("This fault cannot be applied to a batch: " + fault_type)
+
+        return batch.reshape(batch_shape)
+
+    @classmethod
+    def stacked_morphology(cls, batch, fault_type, kernel):
+        """
+        Erosion/Dilation/Gradient of an (N,H,W,C) batch with one OpenCV call per
+        operation. The images are stacked vertically with separator rows of the
+        neutral value of the operation (max for erosion, min for dilation), so
+        the result of every image is identical to the single image fault.
+        """
+        img_count, height, width, channels = batch.shape
+        kernel_size = max(kernel.shape) if kernel.size else 3  # cv2 default: 3x3
+        iterations = 1 if fault_type == "gr" else 5
+        pad = iterations * kernel_size
+
+        def stacked(neutral_value):
+            stack = np.full(
+                (img_count, height + pad, width, channels), neutral_value, batch.dtype
+            )
+            stack[:, :height] = batch
+            return stack.reshape(img_count * (height + pad), width, channels)
+
+        def unstacked(stack):
+            stack = stack.reshape(img_count, height + pad, width, channels)
+            return stack[:, :height]
+
+        max_val = np.iinfo(batch.dtype).max
+        if fault_type == "e":
+            return unstacked(cv2.erode(stacked(max_val), kernel, iterations=iterations))
+        if fault_type == "d":
+            return unstacked(cv2.dilate(stacked(0), kernel, iterations=iterations))
+        dilated = unstacked(cv2.dilate(stacked(0), kernel))
+        eroded = unstacked(cv2.erode(stacked(max_val), kernel))
+        return cv2.subtract(
+            dilated.reshape(-1, width * channels), eroded.reshape(-1, width * channels)
+        ).reshape(batch.shape)
 
     ### TOF Faults ###
+    # imgaug augmenters of the TOF faults. The offline FI uses the equivalent
+    # native kernels in noise_kernels.py, imgaug is only imported when needed.
     @classmethod
     def salt_pepper(cls, fi_rate):
         """Salt&Pepper Noise"""
+        from imgaug import augmenters as iaa
+
         aug_img = iaa.SaltAndPepper(p=fi_rate)
         return aug_img
 
     @classmethod
     def gaussian(cls, fi_rate):
         """Gaussian Noise"""
+        from imgaug import augmenters as iaa
+
         aug_img = iaa.AdditiveGaussianNoise(scale=fi_rate * 255, per_channel=True)
         return aug_img
 
     @classmethod
     def laplacian(cls, fi_rate):  # Will Be Added.
         """Laplacian Noise (Under-development)"""
+        from imgaug import augmenters as iaa
+
         aug_img = iaa.AdditiveLaplaceNoise(loc=0, scale=fi_rate * 255)
         return aug_img
 
     @classmethod
     def poisson(cls, fi_rate):
         """Poisson Noise"""
+        from imgaug import augmenters as iaa
+
         fi_rate = float(fi_rate * 100)
         aug_img = iaa.AdditivePoissonNoise(lam=fi_rate, per_channel=True)
         return aug_img
@@ -162,17 +628,19 @@ class OfflineImageFault:
     @classmethod
     def dilation(cls, img_msg, k):
         """Dilation FI Method"""
-        return cv2.dilate(img_msg, k, iterations=5)
+        # Same result as cv2.dilate(img_msg, k, iterations=5), the iterations
+        # are folded into one window (morphology_kernels.py).
+        return mk.rect_morphology(img_msg, "d", k.shape[0], 5)
 
     @classmethod
     def erosion(cls, img_msg, k):
         """Erosion FI Method"""
-        return cv2.erode(img_msg, k, iterations=5)
+        return mk.rect_morphology(img_msg, "e", k.shape[0], 5)
 
     @classmethod
     def gradient(cls, img_msg, k):
         """Gradient FI Method"""
-        return cv2.morphologyEx(img_msg, cv2.MORPH_GRADIENT, k)
+        return mk.rect_gradient(img_msg, k.shape[0])
 
     @classmethod
     def partialloss(cls, img_msg, kernel):
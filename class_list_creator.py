@@ -3,4 +3,6 @@ class ListCreator(list):
         super(ListCreator, self).__init__(args)
 
     def __sub__(self, other):
-        return self.__class__(*[item for item in self if item not in other])
\ No newline at end of file
+        # Set lookup keeps the subtraction O(n + m), the order of self is kept.
+        excluded_items = set(other)
+        return self.__class__(*[item for item in self if item not in excluded_items])
\ No newline at end of file
@@ -4,11 +4,10 @@ tutulduğu scripttir. Main üzerinden çağrılarak fonksiyonlar kullanılır.
 """
 
 import os
-from os import listdir
-from os.path import isfile, join
 import subprocess
 import datetime
 from gui_restart_app import restart_program as rest
+from fi_discovery import image_scanner
 import webbrowser
 
 
@@ -25,17 +24,21 @@ def go_fiad_app_func():
 
 
 def list_substractor(norm_img_list, fi_img_list):
-    """Liste ayırıcı"""
-    return [x for x in norm_img_list if x not in fi_img_list]
+    """
+    Liste ayırıcı. Removes the names in fi_img_list from norm_img_list and
+    keeps the order of norm_img_list. The excluded names are kept in a set,
+    so this is O(n + m) instead of O(n * m).
+    """
+    excluded_names = set(fi_img_list)
+    return [x for x in norm_img_list if x not in excluded_names]
 
 
 def read_image_list(file_path):
     """
-    Image list reader
+    Image list reader, same image names as the offline FI (see
+    fi_discovery.image_scanner).
     """
-    onlyfiles = [f for f in listdir(file_path) if isfile(join(file_path, f))]
-    image_list = [i.split(".", 1)[0] for i in onlyfiles]
-    return image_list
+    return list(image_scanner(file_path))
 
 
 def get_current_workspace():
@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Faulty Image Cache For Camera FI Demo Tool
+-----------------------------------------------
+On-disk, content-addressed cache of the faulty images written by the offline
+FI. The key of an output is the hash of (input image content, fault type or
+pipeline, fault rate, output format, tool version; the run seed, the image
+name and, when tiled, the tile size for noise faults, whose noise streams are
+keyed by them), so the same faulty image is computed once and then
+linked/copied into every output folder that needs it. The least recently used
+outputs are evicted when the cache is larger than its size limit.
+
+Usage:
+    python fi_cache.py [--cache-dir DIR] info
+    python fi_cache.py [--cache-dir DIR] list
+    python fi_cache.py [--cache-dir DIR] prune --max-size 10G
+    python fi_cache.py [--cache-dir DIR] clear
+"""
+
+import os
+import sys
+import json
+import threading
+import shutil
+import hashlib
+import argparse
+
+# Must follow camfitool_main.__version__, a new version invalidates the cache.
+TOOL_VERSION = "v2.0.0"
+DEFAULT_CACHE_DIR = "fi_cache"
+SIZE_UNITS = {"K": 1024, "M": 1024**2, "G": 1024**3, "T": 1024**4}
+
+
+class FICache:
+    """
+    ### Variables:
+        - cache_dir: Cache folder
+        - max_size: Size limit of the cache in bytes (None: no limit)
+        - seed: Run seed, part of the cache key of the noise faults
+        - link_mode: "hardlink" or "copy", how hits are written to the output
+    """
+
+    def __init__(
+        self,
+        cache_dir=DEFAULT_CACHE_DIR,
+        max_size=None,
+        seed=None,
+        link_mode="hardlink",
+    ):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.seed = seed
+        self.link_mode = link_mode
+
+    def image_key(
+        self,
+        input_path,
+        img_fault_type,
+        fault_type,
+        fault_rate,
+        img_format,
+        codec_params=None,
+        noise_key=None,
+        tile_size=None,
+    ):
+        """
+        Cache key of one output. fault_type is the fault of the run, it decides
+        the TOF/RGB writer also for the images written without fault.
+        img_format and codec_params are the output format and its cv2.imwrite
+        parameters. noise_key is the image name of a noise fault, two images
+        with the same content get different noise. The run seed is only a part
+        of the noise keys, the other faults are deterministic. tile_size is
+        the tile size of a tiled noise fault, its noise has a stream per tile.
+        """
+        content_hash = hashlib.blake2b(digest_size=20)
+        with open(input_path, "rb") as input_file:
+            for block in iter(lambda: input_file.read(1 << 20), b""):
+                content_hash.update(block)
+        fault_key = json.dumps(
+            [
+                img_fault_type,
+                fault_type,
+                fault_rate,
+                img_format,
+                codec_params,
+                TOOL_VERSION,
+            ]
+            + ([] if noise_key is None else [self.seed, noise_key])
+            + ([] if tile_size is None else [tile_size])
+        )
+        return (
+            hashlib.sha256(
+                (content_hash.hexdigest() + fault_key).encode("utf-8")
+            ).hexdigest()
+            + img_format
+        )
+
+    def object_path(self, cache_key):
+        """Path of a cached output."""
+        return os.path.join(self.cache_dir, "objects", cache_key[:2], cache_key)
+
+    def materialize(self, cache_key, output_path):
+        """Writes a cached output to output_path, True on a cache hit."""
+        object_path = self.object_path(cache_key)
+        try:
+            os.utime(object_path)  # LRU: a hit makes the output recent
+            if os.path.lexists(output_path):
+                os.remove(output_path)
+            file_linker(object_path, output_path, self.link_mode)
+        except OSError:
+            return False
+        return True
+
+    def store(self, cache_key, output_path):
+        """Adds a written output to the cache."""
+        object_path = self.object_path(cache_key)
+        if os.path.exists(object_path):
+            return
+        # The threads and processes of a run store at the same time.
+        temp_path = (
+            object_path + ".tmp" + str(os.getpid()) + "-" + str(threading.get_ident())
+        )
+        try:
+            os.makedirs(os.path.dirname(object_path), exist_ok=True)
+            file_linker(output_path, temp_path, self.link_mode)
+            os.replace(temp_path, object_path)
+        except OSError as error_msg:
+            print(error_msg)
+            if os.path.lexists(temp_path):
+                os.remove(temp_path)
+
+    def entries(self):
+        """(path, size, last use time) of the cached outputs."""
+        object_dir = os.path.join(self.cache_dir, "objects")
+        cache_entries = []
+        if not os.path.isdir(object_dir):
+            return cache_entries
+        for prefix_entry in os.scandir(object_dir):
+            if not prefix_entry.is_dir():
+                continue
+            for entry in os.scandir(prefix_entry.path):
+                stat_info = entry.stat()
+                cache_entries.append(
+                    (entry.path, stat_info.st_size, stat_info.st_mtime)
+                )
+        return cache_entries
+
+    def prune(self, max_size=None):
+        """
+        Evicts the least recently used outputs until the cache is not larger
+        than max_size (the cache limit when it is None). Returns the number and
+        size of the evicted outputs.
+        """
+        if max_size is None:
+            max_size = self.max_size
+        if max_size is None:
+            return 0, 0
+        cache_entries = sorted(self.entries(), key=lambda entry: entry[2])
+        total_size = sum(size for _, size, _ in cache_entries)
+        evicted_count = evicted_size = 0
+        for path, size, _ in cache_entries:
+            if total_size <= max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total_size -= size
+            evicted_count += 1
+            evicted_size += size
+        return evicted_count, evicted_size
+
+    def clear(self):
+        """Removes all cached outputs."""
+        shutil.rmtree(os.path.join(self.cache_dir, "objects"), ignore_errors=True)
+
+
+def file_linker(src_path, dst_path, link_mode="hardlink"):
+    """Hardlinks src_path to dst_path, copies it when linking is not possible."""
+    if link_mode == "hardlink":
+        try:
+            os.link(src_path, dst_path)
+            return
+        except OSError:
+            pass
+    shutil.copyfile(src_path, dst_path)
+
+
+def size_parser(size_text):
+    """Converts sizes like 500M or 10G to bytes."""
+    size_text = str(size_text).strip().upper().rstrip("B")
+    if size_text and size_text[-1] in SIZE_UNITS:
+        return int(float(size_text[:-1]) * SIZE_UNITS[size_text[-1]])
+    return int(size_text)
+
+
+def main(argv=None):
+    """Cache inspection/prune command line interface"""
+    parser = argparse.ArgumentParser(description="CamFITool faulty image cache")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("info", help="Show the cache size")
+    subparsers.add_parser("list", help="List the cached outputs, oldest first")
+    prune_parser = subparsers.add_parser(
+        "prune", help="Evict least recently used outputs"
+    )
+    prune_parser.add_argument("--max-size", required=True, help="e.g. 500M, 10G")
+    subparsers.add_parser("clear", help="Remove all cached outputs")
+    args = parser.parse_args(argv)
+
+    fi_cache = FICache(args.cache_dir)
+    if args.command == "info":
+        cache_entries = fi_cache.entries()
+        print("Cache: " + os.path.abspath(args.cache_dir))
+        print("Outputs: " + str(len(cache_entries)))
+        print("Size: " + str(sum(size for _, size, _ in cache_entries)) + " bytes")
+    elif args.command == "list":
+        for path, size, last_use in sorted(
+            fi_cache.entries(), key=lambda entry: entry[2]
+        ):
+            print(f"{last_use:.0f}\t{size}\t{os.path.basename(path)}")
+    elif args.command == "prune":
+        evicted_count, evicted_size = fi_cache.prune(size_parser(args.max_size))
+        print(
+            "Evicted: "
+            + str(evicted_count)
+            + " outputs, "
+            + str(evicted_size)
+            + " bytes"
+        )
+    else:
+        fi_cache.clear()
+        print("Cache cleared.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Image Discovery For Camera FI Demo Tool
+-----------------------------------------------
+Finds the images of a normal image folder in one os.scandir pass, without
+opening the files. Images are found by their extension, so folders mixing
+.png/.bmp/... images and names with dots work, and the files that are not
+images are skipped before the FI starts. The decoders (OpenCV/PIL) detect the
+real format of an image from its content.
+
+image_scanner() returns {image name: image format}; the image name is the
+file name without its extension and the image format is the extension of the
+file (".png", ".bmp"...). Every image is decoded and encoded in its own
+format by the offline FI.
+
+Nested datasets (robot/session/camera/...) are listed recursively by
+image_walker(), a generator over os.scandir that uses the file type of the
+directory entries, so a directory costs one listing and no stat per file.
+The image name of a nested image is its relative path without extension
+("robot1/session2/cam0/000123") and the outputs mirror the same folders.
+Include/exclude globs (fnmatch) are matched against the relative paths,
+excluded folders are not listed at all.
+"""
+
+import os
+from fnmatch import fnmatchcase
+
+# Extension -> format of the image formats OpenCV reads and writes
+IMAGE_EXTENSIONS = {
+    ".png": ".png",
+    ".bmp": ".bmp",
+    ".dib": ".bmp",
+    ".jpg": ".jpg",
+    ".jpeg": ".jpg",
+    ".jpe": ".jpg",
+    ".tif": ".tiff",
+    ".tiff": ".tiff",
+    ".webp": ".webp",
+    ".pgm": ".pgm",
+    ".ppm": ".ppm",
+}
+
+
+def glob_matcher(rel_path, patterns):
+    """True when a relative path ("a/b/1.png") matches one of the globs."""
+    return any(fnmatchcase(rel_path, pattern) for pattern in patterns)
+
+
+def image_walker(ndir_name, recursive=True, include=None, exclude=None, rel_dir=""):
+    """
+    Yields the (relative path, os.DirEntry) of the files in ndir_name, sorted
+    by name in every folder, the sub folders are walked depth first when
+    recursive. include/exclude are lists of globs of the relative paths
+    ("*.png", "*/cam0/*", "*/calib/*"); a folder matching an exclude glob is
+    skipped without listing it. Symlinked folders are not followed.
+    """
+    with os.scandir(ndir_name) as entries:
+        entries = sorted(entries, key=lambda entry: entry.name)
+    for entry in entries:
+        rel_path = rel_dir + entry.name
+        if entry.is_dir(follow_symlinks=False):
+            if recursive and not (exclude and glob_matcher(rel_path + "/", exclude)):
+                yield from image_walker(
+                    entry.path, recursive, include, exclude, rel_path + "/"
+                )
+        elif entry.is_file():
+            if include and not glob_matcher(rel_path, include):
+                continue
+            if exclude and glob_matcher(rel_path, exclude):
+                continue
+            yield rel_path, entry
+
+
+def image_scanner(ndir_name, recursive=False, include=None, exclude=None):
+    """
+    Returns {image name: image format} of the images in ndir_name (see
+    image_walker), sorted by name. Files without an image extension are
+    skipped. When two images have the same name (1.png, 1.bmp) only the first
+    one is used.
+    """
+    img_formats = {}
+    skipped_files = []
+    for rel_path, _ in image_walker(ndir_name, recursive, include, exclude):
+        img_name, img_format = os.path.splitext(rel_path)
+        if img_format.lower() not in IMAGE_EXTENSIONS or img_name in img_formats:
+            skipped_files.append(rel_path)
+            continue
+        img_formats[img_name] = img_format
+
+    file_list_printer(
+        skipped_files, " files are not used (not an image or a duplicate name): "
+    )
+    return img_formats
+
+
+def file_list_printer(file_names, message):
+    """Prints the count and the first names of a file list, if it is not empty."""
+    if file_names:
+        print(
+            str(len(file_names))
+            + message
+            + ", ".join(file_names[:5])
+            + (" ..." if len(file_names) > 5 else "")
+        )
+
+
+def output_dir_creator(fdir_name, img_names):
+    """
+    Creates the sub folders of the nested image names in fdir_name, so the
+    outputs mirror the folders of the normal images. Every folder is created
+    once.
+    """
+    img_dirs = {os.path.dirname(img_name) for img_name in img_names}
+    for img_dir in sorted(img_dirs):
+        if img_dir:
+            os.makedirs(os.path.join(fdir_name, img_dir), exist_ok=True)
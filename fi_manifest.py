@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Offline FI Run Manifest For Camera FI Demo Tool
+-----------------------------------------------
+Every offline FI run writes an append-only manifest (JSON lines) of the
+images that are completed: input size/mtime, output name and whether the
+fault was applied. The manifest file name comes from a hash of the FI plan
+(input/output folders, fault type and rates, selection...), so a rerun of
+the same plan finds it and, when resuming, only processes the images that
+are not completed yet or whose input changed.
+"""
+
+import os
+import json
+import hashlib
+import datetime
+
+
+class FIManifest:
+    """
+    ### Variables:
+        - manifest_dir: Folder of the manifest files
+        - plan: FI plan dict (JSON serializable), identifies the run
+        - ndir_name: Normal image directory (input file) name
+        - fdir_name: Faulty image directory (output file) name
+        - out_format: Output image format (the format of every input image
+          when it is None)
+    """
+
+    def __init__(self, manifest_dir, plan, ndir_name, fdir_name, out_format=None):
+        self.plan = plan
+        self.ndir_name = ndir_name
+        self.fdir_name = fdir_name
+        self.out_format = out_format
+        self.seed = None
+        self.done_images = {}
+        self.manifest_file = None
+
+        plan_key = hashlib.sha1(
+            json.dumps(plan, sort_keys=True).encode("utf-8")
+        ).hexdigest()[:16]
+        os.makedirs(manifest_dir, exist_ok=True)
+        self.manifest_path = os.path.join(
+            manifest_dir, "fi_manifest_" + plan_key + ".jsonl"
+        )
+
+    def last_seed(self):
+        """Selection seed of the last run of this plan (None if there is no run)."""
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as manifest_file:
+                return json.loads(manifest_file.readline()).get("seed")
+        except (OSError, ValueError):
+            return None
+
+    def start(self, seed, resume=False):
+        """
+        Starts the manifest of a run. When resuming with the same seed, the
+        completed images of the last run are loaded and the manifest is
+        continued, otherwise a new manifest is started.
+        """
+        self.seed = seed
+        self.done_images = {}
+        if resume and os.path.exists(self.manifest_path) and self.last_seed() == seed:
+            with open(self.manifest_path, "r", encoding="utf-8") as manifest_file:
+                next(manifest_file)  # header
+                for line in manifest_file:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # last line of a crashed run
+                    self.entry_adder(entry)
+            self.manifest_file = open(self.manifest_path, "a", encoding="utf-8")
+        else:
+            self.manifest_file = open(self.manifest_path, "w", encoding="utf-8")
+            header = {
+                "created": str(datetime.datetime.now()),
+                "plan": self.plan,
+                "seed": seed,
+            }
+            self.manifest_file.write(json.dumps(header) + "\n")
+            self.manifest_file.flush()
+
+    def input_stat(self, img_name, img_format):
+        """Size and mtime of the input image."""
+        stat_info = os.stat(self.ndir_name + img_name + img_format)
+        return stat_info.st_size, stat_info.st_mtime_ns
+
+    def is_done(self, img_name, img_fault_type, img_format):
+        """
+        True when the image job is in the manifest, its input is not changed
+        and its output still exists.
+        """
+        entry = self.done_images.get((img_name, img_fault_type != "nf"))
+        if entry is None:
+            return False
+        try:
+            size, mtime = self.input_stat(img_name, img_format)
+        except OSError:
+            return False
+        return (
+            entry["size"] == size
+            and entry["mtime"] == mtime
+            and os.path.exists(os.path.join(self.fdir_name, entry["output"]))
+        )
+
+    def record(self, img_name, img_fault_type, img_format):
+        """Appends a completed image job to the manifest."""
+        try:
+            size, mtime = self.input_stat(img_name, img_format)
+        except OSError:
+            return
+        entry = {
+            "image": img_name,
+            "fault": img_fault_type != "nf",
+            "fault_type": img_fault_type,
+            "fault_rate": self.plan.get("fault_rate"),
+            "output": img_name + (self.out_format or img_format),
+            "size": size,
+            "mtime": mtime,
+        }
+        self.entry_adder(entry)
+        self.manifest_file.write(json.dumps(entry) + "\n")
+        self.manifest_file.flush()
+
+    def entry_adder(self, entry):
+        """
+        Adds a completed image job. An image written without fault overwrites
+        an earlier faulty output, so its faulty job is not completed anymore.
+        """
+        if not entry["fault"]:
+            self.done_images.pop((entry["image"], True), None)
+        self.done_images[(entry["image"], entry["fault"])] = entry
+
+    def close(self):
+        """Closes the manifest file."""
+        if self.manifest_file is not None:
+            self.manifest_file.close()
+            self.manifest_file = None
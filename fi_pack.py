@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Packed Image Folder For Camera FI Demo Tool
+-----------------------------------------------
+A normal image folder is decoded once into a pack: a raw blob of the decoded
+images (<pack>.dat) and an index of their offset/shape/dtype (<pack>.json).
+The offline FI reads the images of a pack as zero-copy views of a read-only
+memory map, so repeated runs do not decode the images again and the worker
+processes share the same page cache.
+
+Images are packed as the readers of OfflineImageFault return them: "rgb"
+(cv2.imread, BGR) and/or "tof" (PIL). An image whose input file changed
+after packing is read from the folder again. Every entry keeps the format
+of its input file, so mixed-format folders can be packed.
+
+Usage:
+    python fi_pack.py pack NDIR PACK [--mode rgb tof] [--recursive]
+                           [--include GLOB ...] [--exclude GLOB ...]
+    python fi_pack.py info PACK
+"""
+
+import os
+import sys
+import json
+import argparse
+import cv2
+import numpy as np
+from PIL import Image
+
+from fi_discovery import image_scanner
+
+PACK_MODES = ("rgb", "tof")
+PACK_ALIGN = 64
+
+
+class FIPack:
+    """
+    ### Variables:
+        - pack_path: Pack path without extension (<pack>.dat, <pack>.json)
+    """
+
+    def __init__(self, pack_path):
+        self.pack_path = pack_path
+        with open(pack_path + ".json", "r", encoding="utf-8") as index_file:
+            self.index = json.load(index_file)
+        self.ndir_name = self.index["ndir_name"]
+        self.blob = None
+
+    def __getstate__(self):
+        # Worker processes open their own memory map instead of receiving a
+        # pickled copy of the data.
+        state = self.__dict__.copy()
+        state["blob"] = None
+        return state
+
+    def image_names(self, mode):
+        """Names of the packed images of a mode."""
+        return list(self.index["images"].get(mode, {}))
+
+    def image(self, img_name, mode):
+        """
+        Read-only view of a packed image, None when the image is not packed or
+        its input file changed after packing.
+        """
+        entry = self.index["images"].get(mode, {}).get(img_name)
+        if entry is None:
+            return None
+        offset, shape, dtype, size, mtime, img_format = entry
+        try:
+            stat_info = os.stat(os.path.join(self.ndir_name, img_name + img_format))
+        except OSError:
+            return None
+        if stat_info.st_size != size or stat_info.st_mtime_ns != mtime:
+            return None
+        if self.blob is None:
+            self.blob = np.memmap(self.pack_path + ".dat", np.uint8, "r")
+        dtype = np.dtype(dtype)
+        byte_count = int(np.prod(shape)) * dtype.itemsize
+        return self.blob[offset : offset + byte_count].view(dtype).reshape(shape)
+
+    def image_formats(self):
+        """{image format: packed image count} of all modes."""
+        format_counts = {}
+        for mode_images in self.index["images"].values():
+            for entry in mode_images.values():
+                format_counts[entry[5]] = format_counts.get(entry[5], 0) + 1
+        return format_counts
+
+
+def image_decoder(img_path, mode):
+    """Decodes an image like the OfflineImageFault readers of the mode."""
+    if mode == "tof":
+        return np.asarray(Image.open(img_path))
+    image = cv2.imread(img_path)
+    if image is None:
+        raise IOError("Image cannot be read: " + img_path)
+    return image
+
+
+def pack_folder(
+    ndir_name, pack_path, modes=("rgb",), recursive=False, include=None, exclude=None
+):
+    """
+    Decodes the images of ndir_name (and its sub folders when recursive) into
+    a pack, returns the number of packed images. include/exclude are the
+    image globs of image_scanner, so that only the images of a run are packed.
+    The pack is written to temporary files first, an existing pack is only
+    replaced when packing is completed.
+    """
+    ndir_name = os.path.join(os.path.abspath(ndir_name), "")
+    images = {mode: {} for mode in modes}
+    offset = 0
+    with open(pack_path + ".dat.tmp", "wb") as blob_file:
+        img_formats = image_scanner(ndir_name, recursive, include, exclude)
+        for img_name, img_format in img_formats.items():
+            img_path = ndir_name + img_name + img_format
+            try:
+                stat_info = os.stat(img_path)
+                decoded = [(mode, image_decoder(img_path, mode)) for mode in modes]
+            except Exception as error_msg:
+                print(error_msg)
+                continue
+            for mode, image in decoded:
+                image = np.ascontiguousarray(image)
+                blob_file.write(b"\0" * (-offset % PACK_ALIGN))
+                offset += -offset % PACK_ALIGN
+                images[mode][img_name] = [
+                    offset,
+                    list(image.shape),
+                    image.dtype.str,
+                    stat_info.st_size,
+                    stat_info.st_mtime_ns,
+                    img_format,
+                ]
+                blob_file.write(image.tobytes())
+                offset += image.nbytes
+    index = {"ndir_name": ndir_name, "images": images}
+    with open(pack_path + ".json.tmp", "w", encoding="utf-8") as index_file:
+        json.dump(index, index_file)
+    os.replace(pack_path + ".dat.tmp", pack_path + ".dat")
+    os.replace(pack_path + ".json.tmp", pack_path + ".json")
+    return max(len(mode_images) for mode_images in images.values())
+
+
+def main(argv=None):
+    """Pack command line interface"""
+    parser = argparse.ArgumentParser(description="CamFITool image folder pack")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    pack_parser = subparsers.add_parser(
+        "pack", help="Decode an image folder into a pack"
+    )
+    pack_parser.add_argument("ndir_name")
+    pack_parser.add_argument("pack_path")
+    pack_parser.add_argument("--mode", nargs="+", choices=PACK_MODES, default=["rgb"])
+    pack_parser.add_argument("--recursive", action="store_true")
+    pack_parser.add_argument("--include", nargs="+", help="Globs of the image paths")
+    pack_parser.add_argument("--exclude", nargs="+", help="Globs of the image paths")
+    info_parser = subparsers.add_parser("info", help="Show the contents of a pack")
+    info_parser.add_argument("pack_path")
+    args = parser.parse_args(argv)
+
+    if args.command == "pack":
+        img_count = pack_folder(
+            args.ndir_name,
+            args.pack_path,
+            args.mode,
+            args.recursive,
+            args.include,
+            args.exclude,
+        )
+        print("Packed: " + str(img_count) + " images")
+    else:
+        image_pack = FIPack(args.pack_path)
+        format_counts = image_pack.image_formats()
+        print(
+            "Folder: "
+            + image_pack.ndir_name
+            + " ("
+            + ", ".join(
+                str(img_format) + ": " + str(count)
+                for img_format, count in sorted(format_counts.items())
+            )
+            + ")"
+        )
+        for mode, mode_images in image_pack.index["images"].items():
+            print(mode + ": " + str(len(mode_images)) + " images")
+        print("Size: " + str(os.path.getsize(args.pack_path + ".dat")) + " bytes")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,564 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Structured FI Plans For Camera FI Demo Tool
+-----------------------------------------------
+An offline FI plan is a JSON (or TOML, Python 3.11+) document:
+
+    {
+      "version": 1,
+      "name": "tof_noise",
+      "input": {"ndir_name": "images/normal_image_folders/tof_images/"},
+      "output": {"fdir_name": "images/fault_image_folders/tof_noise/"},
+      "faults": [{"type": "Gaussian", "rate": 10}],
+      "selection": {"fimp_rate": 50, "randomized": false, "seed": 5},
+      "execution": {"workers": 4},
+      "sweep": {"fault_types": ["Gaussian", "Poisson"], "rates": [5, 10, 20],
+                "seeds": [1, 2]}
+    }
+
+    - input: ndir_name and the discovery options (recursive, include,
+      exclude, shard_input, pack_path)
+    - output: fdir_name, output_codec, shard_size
+    - faults: one fault or an ordered fault pipeline of {"type", "rate"}
+    - selection: fault implementation rate, randomized FI and seed
+    - execution: the other options of offline_fault_injector_ui.main
+    - sweep (optional): "faults" (a list of fault lists), or "fault_types"
+      and/or "rates" for a one fault plan, and "seeds". The plan is run for
+      every combination, each variant into fdir_name/<variant name>/.
+
+plan_runs() expands a plan into the keyword arguments of the engine and
+plan_executor() runs all variants in one process. When a sweep has several
+variants, they are run in a single pass (offline_fault_injector_ui.sweep_main):
+every normal image is read and decoded once and all variant outputs are
+written from it. Sweeps with the manifest, the cache, a pack, tiling, batches,
+streaming or shard input (or "single_pass": false) run the variants one by
+one; the normal images are then decoded once into a temporary fi_pack.py pack
+that every variant reads ("share_decode": false disables it).
+"""
+
+import os
+import json
+import time
+import random
+import shutil
+import tempfile
+import itertools
+
+PLAN_VERSION = 1
+# Top level keys of a plan besides the sections
+PLAN_KEYS = {"version", "name", "created", "faults"}
+PLAN_SECTIONS = {
+    "input": {
+        "ndir_name",
+        "recursive",
+        "include",
+        "exclude",
+        "shard_input",
+        "pack_path",
+    },
+    "output": {"fdir_name", "output_codec", "shard_size"},
+    "selection": {"fimp_rate", "randomized", "seed"},
+    "execution": {
+        "workers",
+        "copy_mode",
+        "batch_size",
+        "stream_stages",
+        "queue_depth",
+        "manifest_dir",
+        "resume",
+        "cache_dir",
+        "cache_max_size",
+        "tiling",
+        "encode_threads",
+        "share_decode",
+        "single_pass",
+        "shard_index",
+        "shard_count",
+        "executor",
+    },
+    "sweep": {"faults", "fault_types", "rates", "seeds"},
+}
+
+
+def plan_loader(plan_path):
+    """Reads a JSON/TOML plan file."""
+    if plan_path.lower().endswith(".toml"):
+        import tomllib  # Python 3.11+
+
+        with open(plan_path, "rb") as plan_file:
+            return tomllib.load(plan_file)
+    with open(plan_path, "r", encoding="utf-8") as plan_file:
+        return json.load(plan_file)
+
+
+def plan_saver(plan, plan_path):
+    """Writes a plan as JSON."""
+    with open(plan_path, "w", encoding="utf-8") as plan_file:
+        json.dump(plan, plan_file, indent=2)
+        plan_file.write("\n")
+
+
+def is_structured_plan(plan):
+    """True for a structured plan (not a dict of command line options)."""
+    return isinstance(plan, dict) and "faults" in plan
+
+
+def plan_builder(
+    ndir_name,
+    fdir_name,
+    fault_type,
+    fault_rate,
+    fimp_rate=100,
+    randomized=False,
+    seed=None,
+    name=None,
+    **options,
+):
+    """
+    Builds a plan of one fault (or of a pipeline [(fault type, rate), ...],
+    fault_rate is not used then). options are the execution options.
+    """
+    if isinstance(fault_type, (list, tuple)):
+        faults = [
+            {"type": pipe_type, "rate": int(pipe_rate)}
+            for pipe_type, pipe_rate in fault_type
+        ]
+    else:
+        faults = [{"type": fault_type, "rate": int(fault_rate)}]
+    plan = {
+        "version": PLAN_VERSION,
+        "input": {"ndir_name": ndir_name},
+        "output": {"fdir_name": fdir_name},
+        "faults": faults,
+        "selection": {
+            "fimp_rate": int(fimp_rate),
+            "randomized": bool(randomized),
+            "seed": seed,
+        },
+        "execution": options,
+    }
+    if name is not None:
+        plan["name"] = name
+    return plan
+
+
+def fault_list_checker(faults, errors, where="faults", rate_required=True):
+    """Checks a list of {"type", "rate"} faults, the problems go to errors."""
+    if not isinstance(faults, list) or not faults:
+        errors.append(where + ": a non-empty list of faults is expected")
+        return
+    for fault in faults:
+        if not isinstance(fault, dict) or "type" not in fault:
+            errors.append(where + ': every fault needs a "type"')
+            continue
+        fault_type_checker(fault["type"], errors, where)
+        if "rate" in fault:
+            rate_checker(fault["rate"], errors, where + " rate")
+        elif rate_required:
+            errors.append(where + ': every fault needs a "rate"')
+
+
+def fault_type_checker(fault_type, errors, where):
+    """Checks a fault type name/code."""
+    from offline_fault_injector_ui import FAULT_TYPES
+
+    if fault_type not in FAULT_TYPES and fault_type not in FAULT_TYPES.values():
+        errors.append(where + ": unknown fault type " + repr(fault_type))
+
+
+def rate_checker(rate, errors, where, low=1):
+    """Checks a percentage."""
+    if isinstance(rate, bool) or not isinstance(rate, int) or not low <= rate <= 100:
+        errors.append(where + ": an integer " + str(low) + "-100 is expected")
+
+
+def plan_validator(plan):
+    """Returns the list of the problems of a plan, empty when it is valid."""
+    if not isinstance(plan, dict):
+        return ["the plan must be an object"]
+    errors = []
+    if plan.get("version", PLAN_VERSION) != PLAN_VERSION:
+        errors.append("unsupported plan version: " + str(plan.get("version")))
+    for section, keys in PLAN_SECTIONS.items():
+        values = plan.get(section, {})
+        if not isinstance(values, dict):
+            errors.append(section + ": an object is expected")
+            continue
+        for key in sorted(set(values) - keys):
+            errors.append(section + ": unknown option " + repr(key))
+    unknown_sections = set(plan) - set(PLAN_SECTIONS) - PLAN_KEYS
+    for section in sorted(unknown_sections):
+        errors.append("unknown section " + repr(section))
+    if errors:
+        return errors
+
+    if not plan.get("input", {}).get("ndir_name"):
+        errors.append("input: ndir_name is required")
+    if not plan.get("output", {}).get("fdir_name"):
+        errors.append("output: fdir_name is required")
+    sweep = plan.get("sweep", {})
+    # The rate of a one fault plan can come from the rates of the sweep.
+    fault_list_checker(plan.get("faults"), errors, rate_required="rates" not in sweep)
+    selection = plan.get("selection", {})
+    if "fimp_rate" in selection:
+        rate_checker(selection["fimp_rate"], errors, "selection: fimp_rate", 0)
+    execution = plan.get("execution", {})
+    if execution.get("executor", "auto") not in ("auto", "thread", "process"):
+        errors.append("execution: executor must be auto, thread or process")
+    shard_count = execution.get("shard_count", 1)
+    shard_index = execution.get("shard_index", 0)
+    if (
+        isinstance(shard_count, bool)
+        or not isinstance(shard_count, int)
+        or shard_count < 1
+    ):
+        errors.append("execution: shard_count must be a positive integer")
+    elif not isinstance(shard_index, int) or not 0 <= shard_index < shard_count:
+        errors.append("execution: shard_index must be in 0-" + str(shard_count - 1))
+    elif shard_count > 1 and selection.get("seed") is None and "seeds" not in sweep:
+        # Every machine must select the same images.
+        errors.append("selection: a seed is required with shard_count > 1")
+
+    if "faults" in sweep:
+        if not isinstance(sweep["faults"], list) or not sweep["faults"]:
+            errors.append("sweep: faults must be a non-empty list of fault lists")
+        else:
+            for faults in sweep["faults"]:
+                fault_list_checker(faults, errors, "sweep: faults")
+        if "fault_types" in sweep or "rates" in sweep:
+            errors.append("sweep: faults cannot be combined with fault_types/rates")
+    for key in ("fault_types", "rates", "seeds"):
+        if key in sweep and (not isinstance(sweep[key], list) or not sweep[key]):
+            errors.append("sweep: " + key + " must be a non-empty list")
+    if errors:
+        return errors
+    for fault_type in sweep.get("fault_types", []):
+        fault_type_checker(fault_type, errors, "sweep: fault_types")
+    for rate in sweep.get("rates", []):
+        rate_checker(rate, errors, "sweep: rates")
+    if ("fault_types" in sweep or "rates" in sweep) and len(plan["faults"]) > 1:
+        errors.append("sweep: fault_types/rates need a one fault plan, use faults")
+    return errors
+
+
+def variant_namer(faults, seed, with_seed):
+    """Output folder name of a sweep variant, e.g. "gaussian10-seed1"."""
+    name = "+".join(
+        str(fault["type"]).lower().replace("&", "") + str(fault["rate"])
+        for fault in faults
+    )
+    if with_seed:
+        name += "-seed" + str(seed)
+    return name
+
+
+def plan_runs(plan):
+    """
+    Expands a valid plan into a list of (variant name, engine keyword
+    arguments of offline_fault_injector_ui.main). The runs of a plan without
+    a seed share one new seed, so all variants fault the same images.
+    """
+    sweep = plan.get("sweep", {})
+    selection = plan.get("selection", {})
+    if "faults" in sweep:
+        fault_lists = sweep["faults"]
+    else:
+        fault = plan["faults"][0]
+        fault_types = sweep.get("fault_types", [fault["type"]])
+        rates = sweep.get("rates", [fault.get("rate")])
+        fault_lists = [plan["faults"]]
+        if "fault_types" in sweep or "rates" in sweep:
+            fault_lists = [
+                [{"type": fault_type, "rate": rate}]
+                for fault_type, rate in itertools.product(fault_types, rates)
+            ]
+    seed = selection.get("seed")
+    if seed is None:
+        seed = random.SystemRandom().randrange(2**32)
+    seeds = sweep.get("seeds", [seed])
+
+    options = dict(plan.get("execution", {}))
+    options.pop("share_decode", None)
+    options.pop("single_pass", None)
+    for section in ("input", "output"):
+        options.update(plan.get(section, {}))
+    ndir_name = options.pop("ndir_name")
+    fdir_name = options.pop("fdir_name")
+    variant_count = len(fault_lists) * len(seeds)
+
+    runs = []
+    for faults, run_seed in itertools.product(fault_lists, seeds):
+        name = variant_namer(faults, run_seed, len(seeds) > 1)
+        if len(faults) == 1:
+            fault_type, fault_rate = faults[0]["type"], faults[0]["rate"]
+        else:
+            fault_type = [(fault["type"], fault["rate"]) for fault in faults]
+            fault_rate = None
+        run = dict(
+            options,
+            ndir_name=ndir_name,
+            fdir_name=(
+                os.path.join(fdir_name, name, "") if variant_count > 1 else fdir_name
+            ),
+            fault_type=fault_type,
+            fault_rate=fault_rate,
+            randomized=bool(selection.get("randomized", False)),
+            fimp_rate=int(selection.get("fimp_rate", 100)),
+            last_fi_name_list=None,
+            seed=run_seed,
+        )
+        runs.append((name, run))
+    return runs
+
+
+def fi_runner(run):
+    """
+    Runs one engine run (keyword arguments of offline_fault_injector_ui.main)
+    and returns its summary dict.
+    """
+    import offline_fault_injector_ui as offline_fi
+
+    summary = run_summary(run)
+    start = time.perf_counter()
+    try:
+        os.makedirs(run["fdir_name"], exist_ok=True)
+        result = offline_fi.main(**run)
+    except Exception as error_msg:
+        return error_summary(summary, error_msg, start)
+    return result_summary(summary, run, result, start)
+
+
+def sweep_runner(runs):
+    """
+    Runs the engine runs of a sweep with offline_fault_injector_ui.sweep_main,
+    every image is read and decoded once for all runs. Returns the summary
+    dicts of the runs, their elapsed time is the time of the whole sweep.
+    """
+    import offline_fault_injector_ui as offline_fi
+
+    first_run = runs[0]
+    summaries = [run_summary(run) for run in runs]
+    start = time.perf_counter()
+    try:
+        results = offline_fi.sweep_main(
+            first_run["ndir_name"],
+            [
+                (run["fdir_name"], run["fault_type"], run["fault_rate"], run["seed"])
+                for run in runs
+            ],
+            first_run["randomized"],
+            first_run["fimp_rate"],
+            first_run["last_fi_name_list"],
+            workers=first_run.get("workers", 1),
+            copy_mode=first_run.get("copy_mode"),
+            output_codec=first_run.get("output_codec"),
+            recursive=first_run.get("recursive", False),
+            include=first_run.get("include"),
+            exclude=first_run.get("exclude"),
+            shard_size=first_run.get("shard_size"),
+            shard_index=first_run.get("shard_index", 0),
+            shard_count=first_run.get("shard_count", 1),
+            executor=first_run.get("executor", "auto"),
+        )
+    except Exception as error_msg:
+        return [error_summary(summary, error_msg, start) for summary in summaries]
+    return [
+        result_summary(summary, run, result, start)
+        for summary, run, result in zip(summaries, runs, results)
+    ]
+
+
+def single_pass_check(runs):
+    """
+    True when the runs of a sweep can be run by sweep_runner: options that
+    need one engine run per variant (manifest, resume, cache, pack, tiling,
+    batches, streaming, shard input) are not set.
+    """
+    first_run = runs[0]
+    return (
+        len(runs) > 1
+        and first_run.get("manifest_dir") is None
+        and not first_run.get("resume")
+        and first_run.get("cache_dir") is None
+        and first_run.get("pack_path") is None
+        and first_run.get("tiling") is None
+        and first_run.get("stream_stages") is None
+        and first_run.get("batch_size", 1) <= 1
+        and not first_run.get("shard_input")
+    )
+
+
+def run_summary(run):
+    """Summary dict of an engine run before it is run."""
+    summary = {
+        "ndir_name": run["ndir_name"],
+        "fdir_name": run["fdir_name"],
+        "fault_type": run["fault_type"],
+        "fault_rate": run["fault_rate"],
+    }
+    if run.get("shard_count", 1) > 1:
+        summary["shard_index"] = run["shard_index"]
+        summary["shard_count"] = run["shard_count"]
+    return summary
+
+
+def error_summary(summary, error_msg, start):
+    """Completes the summary of a failed run."""
+    summary.update(
+        status="error",
+        error=type(error_msg).__name__ + ": " + str(error_msg),
+        elapsed_s=round(time.perf_counter() - start, 3),
+    )
+    return summary
+
+
+def result_summary(summary, run, result, start):
+    """
+    Completes the summary of a run with its result, the (message, image
+    count, faulty image name list, seed) of the engine.
+    """
+    done, image_count, fi_image_name_list, seed = result
+    if not run.get("randomized") and run.get("fimp_rate", 100) == 100:
+        faulty_count = image_count  # full injection, no selection list
+    else:
+        faulty_count = len(fi_image_name_list)
+    summary.update(
+        status="ok",
+        message=done,
+        image_count=image_count,
+        faulty_count=faulty_count,
+        faulty_images=fi_image_name_list,
+        seed=seed,
+        elapsed_s=round(time.perf_counter() - start, 3),
+    )
+    return summary
+
+
+def summary_merger(summaries):
+    """
+    Merges the summaries of the job shards of a run (see shard_index and
+    shard_count of offline_fault_injector_ui.main) into the summary of one
+    run. Plan summaries, {"status", "runs"}, are merged variant by variant.
+    Raises ValueError when a job shard is missing or repeated, or when the
+    summaries are of different runs.
+    """
+    if summaries and all("runs" in summary for summary in summaries):
+        variant_summaries = {}
+        for summary in summaries:
+            for run in summary["runs"]:
+                variant_summaries.setdefault(run.get("variant"), []).append(run)
+        runs = [shard_merger(runs) for runs in variant_summaries.values()]
+        failed = any(run["status"] != "ok" for run in runs)
+        return {"status": "error" if failed else "ok", "runs": runs}
+    return shard_merger(summaries)
+
+
+def shard_merger(summaries):
+    """Merges the run summaries of the job shards of one run."""
+    if not summaries:
+        raise ValueError("No summary to merge")
+    first = summaries[0]
+    shard_count = first.get("shard_count", 1)
+    shard_indices = sorted(summary.get("shard_index", 0) for summary in summaries)
+    if shard_indices != list(range(shard_count)):
+        raise ValueError(
+            "Job shards 0-"
+            + str(shard_count - 1)
+            + " are expected, found: "
+            + ", ".join(str(index) for index in shard_indices)
+        )
+    run_keys = ("ndir_name", "fault_type", "fault_rate", "shard_count")
+    for summary in summaries:
+        if any(summary.get(key) != first.get(key) for key in run_keys) or (
+            summary.get("seed") != first.get("seed") and summary["status"] == "ok"
+        ):
+            raise ValueError("The summaries are not of the same run")
+
+    merged = {key: value for key, value in first.items() if key != "shard_index"}
+    errors = [summary["error"] for summary in summaries if summary["status"] != "ok"]
+    if errors:
+        merged.pop("message", None)
+        merged.update(status="error", error="; ".join(errors))
+    else:
+        merged.update(
+            status="ok",
+            message="Merged " + str(shard_count) + " job shards",
+            image_count=sum(summary["image_count"] for summary in summaries),
+            faulty_count=sum(summary["faulty_count"] for summary in summaries),
+            faulty_images=sorted(
+                img_name
+                for summary in summaries
+                for img_name in summary["faulty_images"]
+            ),
+        )
+    merged["elapsed_s"] = max(summary["elapsed_s"] for summary in summaries)
+    return merged
+
+
+def plan_executor(plan):
+    """
+    Runs all variants of a plan, returns their summaries (with the variant
+    name). Raises ValueError when the plan is not valid.
+    """
+    errors = plan_validator(plan)
+    if errors:
+        raise ValueError("Invalid FI plan: " + "; ".join(errors))
+    runs = plan_runs(plan)
+    execution = plan.get("execution", {})
+
+    if execution.get("single_pass", True) and single_pass_check(
+        [run for _, run in runs]
+    ):
+        summaries = sweep_runner([run for _, run in runs])
+        for (name, _), summary in zip(runs, summaries):
+            summary["variant"] = name
+        return summaries
+
+    pack_dir = None
+    share_decode = execution.get("share_decode", True)
+    first_run = runs[0][1]
+    if (
+        share_decode
+        and len(runs) > 1
+        and first_run.get("pack_path") is None
+        and not first_run.get("shard_input")
+        and first_run.get("shard_size") is None
+    ):
+        # The images are decoded once for all variants.
+        import offline_fault_injector_ui as offline_fi
+        from fi_pack import pack_folder
+
+        modes = {
+            (
+                "tof"
+                if offline_fi.ofi.tof_fault_check(
+                    offline_fi.fault_plan_converter(run["fault_type"])
+                )
+                else "rgb"
+            )
+            for _, run in runs
+        }
+        pack_dir = tempfile.mkdtemp(prefix="fi_plan_pack_")
+        pack_path = os.path.join(pack_dir, "images")
+        pack_folder(
+            first_run["ndir_name"],
+            pack_path,
+            sorted(modes),
+            first_run.get("recursive", False),
+            first_run.get("include"),
+            first_run.get("exclude"),
+        )
+        for _, run in runs:
+            run["pack_path"] = pack_path
+
+    summaries = []
+    try:
+        for name, run in runs:
+            summary = fi_runner(run)
+            summary["variant"] = name
+            summaries.append(summary)
+    finally:
+        if pack_dir is not None:
+            shutil.rmtree(pack_dir, ignore_errors=True)
+    return summaries
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Work Queue For Camera FI Demo Tool
+-----------------------------------------------
+A work queue of the offline FI jobs in a SQLite file on a shared folder, so
+several machines can run one FI without a broker: every worker leases a
+batch of jobs, works at its own pace and leases the next one. Slow
+(NAS-attached) and fast (local SSD) machines balance themselves.
+
+A lease is kept alive by the heartbeat of the worker. A worker releases its
+batch when it fails; when a worker (or its machine) dies, its lease expires
+after lease_time seconds and another worker takes the batch again. A batch
+that fails MAX_ATTEMPTS times is marked "failed" and not leased again, the
+run then fails (its images are not in written_images). The
+leases use time.time(), the clocks of the machines must be synchronized.
+
+The queue also stores the run information (folders, fault, execution
+options) of the jobs, a worker only needs the queue path. Adding the jobs of
+the same run to an existing queue does nothing, so a run is resumed by
+starting it again. SQLite locking needs a file system with working POSIX
+locks (local disks, NFSv4, SMB); the queue is small, one row per batch.
+"""
+
+import os
+import json
+import time
+import socket
+import sqlite3
+import threading
+import contextlib
+
+DEFAULT_LEASE_TIME = 60.0  # seconds
+DEFAULT_QUEUE_BATCH = 32  # jobs per lease
+MAX_ATTEMPTS = 3
+
+
+class FIQueue:
+    """
+    ### Variables:
+        - queue_path: SQLite file of the queue (on a folder shared by the
+          machines)
+        - lease_time: A lease expires lease_time seconds after the last
+          heartbeat of its worker
+    """
+
+    def __init__(self, queue_path, lease_time=DEFAULT_LEASE_TIME):
+        self.queue_path = queue_path
+        self.lease_time = float(lease_time)
+        with self.connection() as db:
+            db.execute("PRAGMA journal_mode=DELETE")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)"
+            )
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS batches ("
+                "batch_id INTEGER PRIMARY KEY, jobs TEXT NOT NULL, "
+                "state TEXT NOT NULL DEFAULT 'pending', worker TEXT, "
+                "lease_until REAL, attempts INTEGER NOT NULL DEFAULT 0, written TEXT)"
+            )
+
+    @contextlib.contextmanager
+    def connection(self):
+        """
+        A connection in autocommit mode. Every operation opens its own
+        connection, so heartbeat threads and processes never share one.
+        """
+        db = sqlite3.connect(self.queue_path, timeout=60, isolation_level=None)
+        try:
+            yield db
+        finally:
+            db.close()
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """A write transaction, the queue is locked until it ends."""
+        with self.connection() as db:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                yield db
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            db.execute("COMMIT")
+
+    def job_adder(self, run_info, fault_jobs, batch_size=DEFAULT_QUEUE_BATCH):
+        """
+        Adds the fault jobs of a run in batches of batch_size jobs, run_info
+        is the JSON-serializable information the workers need. Returns the
+        number of new batches, 0 when the queue already has the jobs of the
+        run. Raises ValueError when the queue belongs to another run.
+        """
+        run_info = json.dumps(run_info, sort_keys=True)
+        with self.transaction() as db:
+            row = db.execute("SELECT value FROM meta WHERE key = 'run'").fetchone()
+            if row is not None:
+                if row[0] != run_info:
+                    raise ValueError("The work queue belongs to another run")
+                return 0
+            db.execute("INSERT INTO meta VALUES ('run', ?)", (run_info,))
+            batches = [
+                (json.dumps(fault_jobs[i : i + batch_size]),)
+                for i in range(0, len(fault_jobs), batch_size)
+            ]
+            db.executemany("INSERT INTO batches (jobs) VALUES (?)", batches)
+        return len(batches)
+
+    def run_info(self):
+        """The run information of the queue, None when it has no jobs yet."""
+        with self.connection() as db:
+            row = db.execute("SELECT value FROM meta WHERE key = 'run'").fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def lease(self, worker_id):
+        """
+        Leases the next pending (or expired) batch to worker_id. Returns
+        (batch id, fault jobs), None when there is no batch to lease.
+        """
+        now = time.time()
+        with self.transaction() as db:
+            # Expired leases of dead workers are returned to the queue.
+            db.execute(
+                "UPDATE batches SET state = CASE WHEN attempts >= ? THEN 'failed' "
+                "ELSE 'pending' END, worker = NULL "
+                "WHERE state = 'leased' AND lease_until < ?",
+                (MAX_ATTEMPTS, now),
+            )
+            row = db.execute(
+                "SELECT batch_id, jobs FROM batches WHERE state = 'pending' "
+                "ORDER BY batch_id LIMIT 1"
+            ).fetchone()
+            if row is None:
+                return None
+            db.execute(
+                "UPDATE batches SET state = 'leased', worker = ?, lease_until = ?, "
+                "attempts = attempts + 1 WHERE batch_id = ?",
+                (worker_id, now + self.lease_time, row[0]),
+            )
+        return row[0], [tuple(job) for job in json.loads(row[1])]
+
+    def heartbeat(self, worker_id, batch_id):
+        """Extends a lease, False when the worker does not hold it any more."""
+        with self.transaction() as db:
+            updated = db.execute(
+                "UPDATE batches SET lease_until = ? "
+                "WHERE batch_id = ? AND worker = ? AND state = 'leased'",
+                (time.time() + self.lease_time, batch_id, worker_id),
+            ).rowcount
+        return updated == 1
+
+    def complete(self, worker_id, batch_id, written_images):
+        """Marks a leased batch done with the names of its written images."""
+        with self.transaction() as db:
+            db.execute(
+                "UPDATE batches SET state = 'done', worker = NULL, written = ? "
+                "WHERE batch_id = ? AND worker = ? AND state = 'leased'",
+                (json.dumps(written_images), batch_id, worker_id),
+            )
+
+    def release(self, worker_id, batch_id):
+        """Returns a leased batch to the queue (failed after MAX_ATTEMPTS)."""
+        with self.transaction() as db:
+            db.execute(
+                "UPDATE batches SET state = CASE WHEN attempts >= ? THEN 'failed' "
+                "ELSE 'pending' END, worker = NULL "
+                "WHERE batch_id = ? AND worker = ? AND state = 'leased'",
+                (MAX_ATTEMPTS, batch_id, worker_id),
+            )
+
+    def progress(self):
+        """{state: batch count} of the queue."""
+        with self.connection() as db:
+            return dict(
+                db.execute("SELECT state, COUNT(*) FROM batches GROUP BY state")
+            )
+
+    def is_drained(self):
+        """
+        True when no batch is pending or leased, the failed batches are not run
+        again (see progress).
+        """
+        progress = self.progress()
+        return not progress.get("pending") and not progress.get("leased")
+
+    def written_images(self):
+        """Names of the written images of the done batches, in job order."""
+        with self.connection() as db:
+            rows = db.execute(
+                "SELECT written FROM batches WHERE state = 'done' ORDER BY batch_id"
+            ).fetchall()
+        return [img_name for (written,) in rows for img_name in json.loads(written)]
+
+    def batch_runner(self, job_worker, worker_id=None, poll_time=1.0):
+        """
+        Leases and runs batches until the queue is drained. job_worker runs
+        one fault job and returns (image name, written). While a batch runs,
+        a heartbeat thread keeps its lease. A batch is released when
+        job_worker raises. Returns the number of completed batches.
+        """
+        if worker_id is None:
+            worker_id = worker_id_finder()
+        batch_count = 0
+        while True:
+            leased = self.lease(worker_id)
+            if leased is None:
+                if self.is_drained():
+                    return batch_count
+                # The other batches are leased, one of them may expire.
+                time.sleep(poll_time)
+                continue
+            batch_id, fault_jobs = leased
+            stop_heartbeat = threading.Event()
+            heartbeat_thread = threading.Thread(
+                target=self.heartbeater,
+                args=(worker_id, batch_id, stop_heartbeat),
+                daemon=True,
+            )
+            heartbeat_thread.start()
+            try:
+                written_images = [
+                    img_name for img_name, done in map(job_worker, fault_jobs) if done
+                ]
+            except BaseException:
+                self.release(worker_id, batch_id)
+                raise
+            finally:
+                stop_heartbeat.set()
+                heartbeat_thread.join()
+            self.complete(worker_id, batch_id, written_images)
+            batch_count += 1
+
+    def heartbeater(self, worker_id, batch_id, stop_heartbeat):
+        """Heartbeat thread of a leased batch."""
+        while not stop_heartbeat.wait(self.lease_time / 3):
+            try:
+                if not self.heartbeat(worker_id, batch_id):
+                    return
+            except sqlite3.Error as error_msg:
+                print(error_msg)
+
+
+def worker_id_finder():
+    """Worker id of this thread, <host name>:<process id>:<thread id>."""
+    return (
+        socket.gethostname() + ":" + str(os.getpid()) + ":" + str(threading.get_ident())
+    )
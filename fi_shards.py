@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Image Shards For Camera FI Demo Tool
+-----------------------------------------------
+Millions of small image files are slow to list, copy and rsync. The offline
+FI can read the normal images from tar/zip shards and write the faulty
+images into size-bounded tar shards instead of one file per image.
+
+The shards follow the WebDataset layout: the files of a sample are stored
+next to each other and share a key, the member name without its extension
+("r1/cam0/000123.png" + "r1/cam0/000123.json"). Every output sample has the
+faulty image and a JSON label (source shard, fault type and rate, the label
+of the input sample if it has one).
+
+Shards are read and written sequentially: tar shards as one stream, zip
+shards in the order of their members. An output shard is written as
+<shard>.tar.tmp and renamed when it is complete.
+"""
+
+import os
+import io
+import json
+import tarfile
+import zipfile
+
+from fi_discovery import IMAGE_EXTENSIONS, file_list_printer
+
+SHARD_EXTENSIONS = (".tar", ".tar.gz", ".tgz", ".zip")
+DEFAULT_SHARD_SIZE = 1 << 30  # 1 GiB
+TAR_BLOCK = 512
+
+
+def shard_finder(ndir_name):
+    """
+    Shard paths of the input: ndir_name itself when it is a shard file,
+    otherwise the shard files of the ndir_name folder, sorted by name.
+    """
+    if os.path.isfile(ndir_name):
+        return [ndir_name]
+    with os.scandir(ndir_name) as entries:
+        return sorted(
+            entry.path
+            for entry in entries
+            if entry.is_file() and entry.name.lower().endswith(SHARD_EXTENSIONS)
+        )
+
+
+def shard_stem(shard_path):
+    """Shard file name without the shard extension."""
+    shard_name = os.path.basename(shard_path)
+    for shard_ext in SHARD_EXTENSIONS:
+        if shard_name.lower().endswith(shard_ext):
+            return shard_name[: -len(shard_ext)]
+    return shard_name
+
+
+def shard_member_names(shard_path):
+    """
+    Names of the file members of a shard, in shard order. Only the member
+    headers of an uncompressed tar are read, a compressed tar is decompressed
+    once as a stream.
+    """
+    if shard_path.lower().endswith(".zip"):
+        with zipfile.ZipFile(shard_path) as zip_file:
+            return [info.filename for info in zip_file.infolist() if not info.is_dir()]
+    tar_mode = "r:" if shard_path.lower().endswith(".tar") else "r|*"
+    with tarfile.open(shard_path, tar_mode) as tar_file:
+        # The members are not kept by tar_file.getmembers(), the names are
+        # collected while the headers are read.
+        return [member.name for member in tar_file if member.isfile()]
+
+
+def shard_image_scanner(shard_paths):
+    """
+    Returns {image name: (image format, shard path)} of the images of the
+    shards, in shard order. The image name is the sample key. When two images
+    have the same name only the first one is used.
+    """
+    img_sources = {}
+    skipped_files = []
+    for shard_path in shard_paths:
+        for member_name in shard_member_names(shard_path):
+            img_name, img_format = os.path.splitext(member_name)
+            if img_format.lower() not in IMAGE_EXTENSIONS:
+                if img_format.lower() != ".json":
+                    skipped_files.append(member_name)
+                continue
+            if img_name in img_sources:
+                skipped_files.append(member_name)
+                continue
+            img_sources[img_name] = (img_format, shard_path)
+
+    file_list_printer(
+        skipped_files,
+        " shard members are not used (not an image or a duplicate name): ",
+    )
+    return img_sources
+
+
+def shard_member_reader(shard_path):
+    """Yields the (member name, bytes) of the file members of a shard in order."""
+    if shard_path.lower().endswith(".zip"):
+        with zipfile.ZipFile(shard_path) as zip_file:
+            for info in zip_file.infolist():
+                if not info.is_dir():
+                    yield info.filename, zip_file.read(info)
+        return
+    # "r|*" reads the tar as a stream, without seeking back.
+    with tarfile.open(shard_path, "r|*") as tar_file:
+        for member in tar_file:
+            if member.isfile():
+                yield member.name, tar_file.extractfile(member).read()
+
+
+def shard_sample_reader(shard_path):
+    """
+    Yields the (sample key, {extension: bytes}) of the samples of a shard.
+    The files of a sample are next to each other in the shard.
+    """
+    sample_key, sample = None, {}
+    for member_name, data in shard_member_reader(shard_path):
+        key, ext = os.path.splitext(member_name)
+        if key != sample_key and sample:
+            yield sample_key, sample
+            sample = {}
+        sample_key = key
+        sample[ext] = data
+    if sample:
+        yield sample_key, sample
+
+
+class ShardWriter:
+    """
+    ### Variables:
+        - fdir_name: Faulty image directory (output file) name
+        - prefix: Name prefix of the shards, <prefix>-000000.tar, ...
+        - max_size: A new shard is started before a shard file (with the
+          end-of-archive blocks and the record padding of tar) grows above
+          max_size bytes (a larger sample gets a shard of its own)
+    """
+
+    def __init__(self, fdir_name, prefix, max_size=DEFAULT_SHARD_SIZE):
+        self.fdir_name = fdir_name
+        self.prefix = prefix
+        self.max_size = max_size
+        self.shard_paths = []
+        self.tar_file = None
+        self.shard_size = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write(self, key, files):
+        """Writes a sample, files is {extension: bytes}."""
+        members = []
+        for ext, data in files.items():
+            member = tarfile.TarInfo(key + ext)
+            member.size = len(data)
+            member.mode = 0o644
+            members.append((member, data))
+        # tar headers (with the PAX headers of long names) + data padded to
+        # whole blocks
+        sample_size = sum(
+            len(member.tobuf(tarfile.PAX_FORMAT, tarfile.ENCODING, "surrogateescape"))
+            + -(-len(data) // TAR_BLOCK) * TAR_BLOCK
+            for member, data in members
+        )
+        if (
+            self.tar_file is not None
+            and tar_file_size(self.shard_size + sample_size) > self.max_size
+        ):
+            self.close()
+        if self.tar_file is None:
+            self.shard_opener()
+        for member, data in members:
+            self.tar_file.addfile(member, io.BytesIO(data))
+        self.shard_size += sample_size
+
+    def shard_opener(self):
+        """Starts the next shard."""
+        shard_name = self.prefix + "-" + str(len(self.shard_paths)).zfill(6) + ".tar"
+        shard_path = os.path.join(self.fdir_name, shard_name)
+        self.shard_paths.append(shard_path)
+        self.tar_file = tarfile.open(
+            shard_path + ".tmp", "w", format=tarfile.PAX_FORMAT
+        )
+        self.shard_size = 0
+
+    def close(self):
+        """Completes the current shard."""
+        if self.tar_file is not None:
+            self.tar_file.close()
+            self.tar_file = None
+            os.replace(self.shard_paths[-1] + ".tmp", self.shard_paths[-1])
+
+
+def tar_file_size(member_size):
+    """
+    Size of a tar file with member_size bytes of members: the end-of-archive
+    blocks are added and the file is padded to whole tar records.
+    """
+    return -(-(member_size + 2 * TAR_BLOCK) // tarfile.RECORDSIZE) * tarfile.RECORDSIZE
+
+
+def sample_label(img_name, img_format, source, img_fault_type, fault_rate, label=None):
+    """JSON label (bytes) of an output sample."""
+    sample_info = {
+        "image": img_name + img_format,
+        "source": os.path.basename(source.rstrip(os.sep)),
+        "fault": img_fault_type != "nf",
+        "fault_type": img_fault_type,
+        "fault_rate": fault_rate if img_fault_type != "nf" else None,
+    }
+    if label is not None:
+        try:
+            sample_info["label"] = json.loads(label)
+        except ValueError:
+            sample_info["label"] = label.decode("utf-8", "replace")
+    return json.dumps(sample_info).encode("utf-8")
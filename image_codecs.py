@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Output Codecs For Camera FI Demo Tool
+-----------------------------------------------
+Output codec options of the offline FI. A codec is given as "name[:option]":
+    - same: format of the input images, OpenCV default parameters
+    - png[:0-9]: PNG with a zlib compression level, without a level OpenCV's
+      default (level 1 with the fast RLE strategy) is used
+    - webp: lossless WebP
+    - tiff[:none|lzw|deflate|packbits]: TIFF with a compression
+    - bmp: uncompressed BMP
+codec_parser() converts it to (output format, cv2.imwrite parameters).
+"""
+
+import cv2
+
+TIFF_COMPRESSIONS = {"none": 1, "lzw": 5, "deflate": 8, "packbits": 32773}
+OUTPUT_CODECS = ("same", "png", "webp", "tiff", "bmp")
+
+
+def codec_parser(codec, img_format):
+    """
+    Returns the (output format, cv2.imwrite parameters) of a codec. img_format
+    is the format of the input images, used by "same".
+    """
+    if codec is None:
+        codec = "same"
+    name, _, option = str(codec).lower().partition(":")
+    if name == "same":
+        return img_format, []
+    if name == "png":
+        if not option:
+            return ".png", []
+        level = int(option)
+        if not 0 <= level <= 9:
+            raise ValueError("PNG compression level must be 0-9: " + option)
+        return ".png", [cv2.IMWRITE_PNG_COMPRESSION, level]
+    if name == "webp":
+        # WebP quality above 100 selects the lossless mode.
+        return ".webp", [cv2.IMWRITE_WEBP_QUALITY, 101]
+    if name in {"tiff", "tif"}:
+        compression = option or "lzw"
+        if compression not in TIFF_COMPRESSIONS:
+            raise ValueError("Unknown TIFF compression: " + compression)
+        return ".tiff", [cv2.IMWRITE_TIFF_COMPRESSION, TIFF_COMPRESSIONS[compression]]
+    if name == "bmp":
+        return ".bmp", []
+    raise ValueError("Unknown output codec: " + str(codec))
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Rectangular Morphology Kernels For Camera FI Demo Tool
+-----------------------------------------------
+Erosion/Dilation/Gradient of OfflineImageFault with a square np.ones kernel,
+bit-identical to cv2.erode/cv2.dilate(image, kernel, iterations) and
+cv2.morphologyEx(image, cv2.MORPH_GRADIENT, kernel):
+    - The iterations are folded into one equivalent rectangle: k x k applied
+      n times is (k + (n - 1) * (k - 1)) wide, its anchor is n * (k // 2).
+    - A rectangle is separable into one row and one column pass.
+    - Every 1-D pass is a sliding window min/max, computed with OpenCV's
+      rectangle filter ("cv2") or with the van Herk/Gil-Werman algorithm
+      ("vhgw"), which needs 3 min/max per pixel whatever the window size.
+
+Outside the image the neutral value of the operation is used (cv2's default
+constant border): dtype max for erosion, dtype min for dilation.
+
+With OpenCV's SIMD row filter "cv2" is faster for the windows of the 1-100%
+fault rate range (folded windows up to 96 px). "vhgw" is faster above about
+VHGW_MIN_SIZE px, see benchmarks/morphology_benchmark.py.
+"""
+
+import cv2
+import numpy as np
+
+# Folded window size from which "auto" uses the van Herk/Gil-Werman passes.
+VHGW_MIN_SIZE = 400
+MORPH_METHODS = ("auto", "cv2", "separable", "vhgw")
+
+
+def folded_window(kernel_size, iterations):
+    """
+    (window size, anchor) of the rectangle equal to iterations passes of a
+    kernel_size x kernel_size kernel. Size 0 is cv2's default 3x3 kernel.
+    """
+    if kernel_size == 0:
+        kernel_size = 3
+    window = kernel_size + (iterations - 1) * (kernel_size - 1)
+    return window, iterations * (kernel_size // 2)
+
+
+def neutral_value(dtype, fault_type):
+    """Border value that does not change the result of erosion/dilation."""
+    if np.issubdtype(dtype, np.integer):
+        limits = np.iinfo(dtype)
+    else:
+        limits = np.finfo(dtype)
+    return limits.max if fault_type == "e" else limits.min
+
+
+def vhgw_rows(image, window, anchor, fault_type):
+    """
+    van Herk/Gil-Werman sliding window min/max along axis 0 of an (H, M)
+    array. The padded rows are split into blocks of `window` rows, a forward
+    and a backward running min/max is computed in every block and the window
+    of row y is the min/max of the backward run at y and the forward run at
+    y + window - 1.
+    """
+    height = image.shape[0]
+    block_count = -(-(height + window - 1) // window)
+    padded = np.full(
+        (block_count * window,) + image.shape[1:],
+        neutral_value(image.dtype, fault_type),
+        image.dtype,
+    )
+    padded[anchor : anchor + height] = image
+    operation = np.minimum if fault_type == "e" else np.maximum
+
+    blocks = padded.reshape((block_count, window) + image.shape[1:])
+    forward = blocks.copy()
+    backward = blocks.copy()
+    for row in range(1, window):
+        operation(forward[:, row - 1], blocks[:, row], out=forward[:, row])
+        back_row = window - row - 1
+        operation(
+            backward[:, back_row + 1], blocks[:, back_row], out=backward[:, back_row]
+        )
+
+    forward = forward.reshape(padded.shape)
+    backward = backward.reshape(padded.shape)
+    return operation(backward[:height], forward[window - 1 : window - 1 + height])
+
+
+def vhgw_rect(image, window, anchor, fault_type):
+    """Separable van Herk/Gil-Werman erosion/dilation of a 2-D/3-D image."""
+    height, width = image.shape[:2]
+    channels = image.shape[2] if image.ndim == 3 else 1
+    # Column pass on rows of W*C values, then the row pass on the transpose.
+    result = vhgw_rows(
+        image.reshape(height, width * channels), window, anchor, fault_type
+    )
+    result = np.ascontiguousarray(
+        result.reshape(height, width, channels).transpose(1, 0, 2)
+    ).reshape(width, height * channels)
+    result = vhgw_rows(result, window, anchor, fault_type)
+    result = result.reshape(width, height, channels).transpose(1, 0, 2)
+    return np.ascontiguousarray(result).reshape(image.shape)
+
+
+def rect_morphology(
+    image, fault_type, kernel_size, iterations=1, dst=None, method="auto"
+):
+    """
+    Erosion ("e") or dilation ("d") of an image with a kernel_size x
+    kernel_size rectangle applied `iterations` times, folded into one window.
+    method is one of MORPH_METHODS. dst is an optional output buffer.
+    """
+    if method not in MORPH_METHODS:
+        raise ValueError("Unknown morphology method: " + str(method))
+    window, anchor = folded_window(kernel_size, iterations)
+    if method == "auto":
+        method = "vhgw" if window >= VHGW_MIN_SIZE else "cv2"
+    cv2_morph = cv2.erode if fault_type == "e" else cv2.dilate
+
+    if window == 1:
+        result = image  # 1x1 window: the image is not changed
+    elif method == "cv2":
+        kernel = np.ones((window, window), np.uint8)
+        return cv2_morph(image, kernel, dst=dst, anchor=(anchor, anchor))
+    elif method == "separable":
+        result = cv2_morph(image, np.ones((1, window), np.uint8), anchor=(anchor, 0))
+        return cv2_morph(
+            result, np.ones((window, 1), np.uint8), dst=dst, anchor=(0, anchor)
+        )
+    else:
+        result = vhgw_rect(image, window, anchor, fault_type)
+
+    if dst is None:
+        return np.array(result)
+    np.copyto(dst, result)
+    return dst
+
+
+def rect_gradient(image, kernel_size, dst=None, method="auto"):
+    """Morphological gradient (dilation - erosion) with one kernel pass."""
+    window, anchor = folded_window(kernel_size, 1)
+    if method == "cv2" or (method == "auto" and window < VHGW_MIN_SIZE):
+        # One OpenCV call is faster than the dilation, erosion and subtraction.
+        kernel = np.ones((window, window), np.uint8)
+        return cv2.morphologyEx(
+            image, cv2.MORPH_GRADIENT, kernel, dst=dst, anchor=(anchor, anchor)
+        )
+    dilated = rect_morphology(image, "d", kernel_size, 1, method=method)
+    eroded = rect_morphology(image, "e", kernel_size, 1, method=method)
+    return cv2.subtract(dilated, eroded, dst=dst)
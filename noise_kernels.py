@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Native Noise Kernels For Camera FI Demo Tool
+-----------------------------------------------
+NumPy/OpenCV implementations of the noise faults of OfflineImageFault. They
+work directly on uint8/uint16 image buffers (any shape) with saturating
+arithmetic and float32 temporaries, and give the same statistics as the
+imgaug augmenters used before:
+    - salt_pepper() -> iaa.SaltAndPepper(p, per_channel=False)
+    - gaussian_noise() -> iaa.AdditiveGaussianNoise(scale, per_channel=True)
+    - poisson_noise() -> iaa.AdditivePoissonNoise(lam, per_channel=True)
+
+rng: numpy.random.Generator for reproducible noise. When it is None, the
+noise is sampled in place with OpenCV's cv2.randn/cv2.randu, which are seeded
+once per thread. With rng the noise is always drawn from the Generator, an
+OpenCV seed derived from it could repeat between images. For a batch of
+images (N,H,W,C), rng can also be a list of N Generators, one noise stream per
+image; every image then gets the same noise as it would get on its own with
+its Generator.
+
+image_rng() gives the Generator of one image of an offline FI run: an
+independent stream of the run seed keyed by the image name, so the noise of
+an image does not depend on the worker count, the job order or the sharding.
+"""
+
+import os
+import math
+import hashlib
+import threading
+from functools import lru_cache
+import cv2
+import numpy as np
+
+CV2_DEPTHS = {np.dtype(np.uint8): cv2.CV_8U, np.dtype(np.uint16): cv2.CV_16U}
+# Resolution (bits) of the uniform samples used for the Poisson lookup table.
+POISSON_TABLE_BITS = 20
+
+_cv2_rng_state = threading.local()
+
+
+def dtype_max(image):
+    """Maximum value of the image dtype (255 for uint8, 65535 for uint16)."""
+    if image.dtype not in CV2_DEPTHS:
+        raise TypeError("Unsupported image dtype: " + str(image.dtype))
+    return np.iinfo(image.dtype).max
+
+
+def cv2_rng_seeder():
+    """
+    OpenCV's RNG starts from the same state in every thread and process, so it
+    is seeded from the OS once per (process, thread) before it is used.
+    """
+    if getattr(_cv2_rng_state, "pid", None) != os.getpid():
+        cv2.setRNGSeed(int.from_bytes(os.urandom(4), "little") & 0x7FFFFFFF)
+        _cv2_rng_state.pid = os.getpid()
+
+
+def image_rng(seed, img_name):
+    """
+    numpy Generator of the noise of one image. The stream is the child of
+    SeedSequence(seed) with the spawn key of a stable hash (BLAKE2b) of the
+    image name (relative path), as SeedSequence.spawn would give it, so the
+    streams of the images are independent and need no shared state.
+    """
+    name_hash = hashlib.blake2b(img_name.encode("utf-8"), digest_size=8).digest()
+    seed_seq = np.random.SeedSequence(
+        int(seed), spawn_key=(int.from_bytes(name_hash, "big"),)
+    )
+    return np.random.Generator(np.random.PCG64(seed_seq))
+
+
+def flat_view(array):
+    """2-D single channel view of a contiguous array for elementwise cv2 calls."""
+    return array.reshape(-1, array.shape[-1] if array.ndim > 1 else 1)
+
+
+def saturating_add(image, noise, out=None):
+    """
+    Adds the float32 (or int16) noise to the image with rounding and saturation
+    to the image dtype. out may be the image itself for in-place operation.
+    """
+    depth = CV2_DEPTHS[image.dtype]
+    image = np.ascontiguousarray(image)
+    if out is None:
+        out = np.empty_like(image)
+    cv2.add(flat_view(image), flat_view(noise), dst=flat_view(out), dtype=depth)
+    return out
+
+
+def is_rng_list(rng):
+    """True when rng holds one Generator per image of a batch."""
+    return isinstance(rng, (list, tuple))
+
+
+def uniform_samples(shape, rng=None):
+    """float32 samples from U(0, 1)."""
+    if is_rng_list(rng):
+        samples = np.empty(shape, np.float32)
+        for image_samples, image_rng in zip(samples, rng):
+            image_rng.random(dtype=np.float32, out=image_samples)
+        return samples
+    if rng is not None:
+        return rng.random(shape, dtype=np.float32)
+    cv2_rng_seeder()
+    samples = np.empty(shape, np.float32)
+    if samples.size:
+        cv2.randu(flat_view(samples), 0.0, 1.0)
+    return samples
+
+
+def gaussian_noise(image, scale, rng=None, out=None):
+    """Additive Gaussian noise N(0, scale) for every pixel and channel."""
+    dtype_max(image)
+    noise = np.empty(image.shape, np.float32)
+    if is_rng_list(rng):
+        for image_noise, image_rng in zip(noise, rng):
+            image_rng.standard_normal(dtype=np.float32, out=image_noise)
+        noise *= scale
+    elif rng is not None:
+        # The noise is filled from the Generator itself, so the noise of every
+        # image is an independent stream of the run seed (see image_rng).
+        rng.standard_normal(dtype=np.float32, out=noise)
+        noise *= scale
+    elif noise.size:
+        cv2_rng_seeder()
+        cv2.randn(flat_view(noise), 0.0, float(scale))
+    return saturating_add(image, noise, out)
+
+
+@lru_cache(maxsize=16)
+def poisson_table(lam):
+    """
+    Lookup table of signed Poisson(lam) samples. Entry 2*i (+) and 2*i+1 (-)
+    hold the inverse CDF of the uniform value (i + 0.5) / 2**POISSON_TABLE_BITS,
+    so one random integer gives both the sign and the Poisson sample.
+    """
+    size = int(lam + 12 * math.sqrt(lam) + 12)
+    values = np.arange(size)
+    log_pmf = (
+        values * math.log(lam) - lam - np.array([math.lgamma(k + 1) for k in values])
+    )
+    cdf = np.cumsum(np.exp(log_pmf))
+    uniform = (np.arange(1 << POISSON_TABLE_BITS) + 0.5) / (1 << POISSON_TABLE_BITS)
+    samples = np.searchsorted(cdf, uniform, side="right").astype(np.int16)
+    return np.stack([samples, -samples], axis=1).reshape(-1)
+
+
+def poisson_noise(image, lam, rng=None, out=None):
+    """
+    Additive Poisson noise with a random sign for every pixel and channel.
+    The samples are drawn with a lookup table (poisson_table()), tail
+    probabilities below 2**-POISSON_TABLE_BITS are truncated.
+    """
+    dtype_max(image)
+    if lam <= 0:
+        return saturating_add(image, np.zeros(image.shape, np.int16), out)
+
+    table_size = 1 << (POISSON_TABLE_BITS + 1)
+    if is_rng_list(rng):
+        index = np.empty(image.shape, np.int32)
+        for image_index, image_rng in zip(index, rng):
+            image_index[...] = image_rng.integers(
+                0, table_size, image_index.shape, dtype=np.int32
+            )
+    elif rng is not None:
+        index = rng.integers(0, table_size, image.shape, dtype=np.int32)
+    else:
+        index = np.empty(image.shape, np.int32)
+        if index.size:
+            cv2_rng_seeder()
+            cv2.randu(flat_view(index), 0, table_size)
+    noise = np.take(poisson_table(float(lam)), index)
+    return saturating_add(image, noise, out)
+
+
+def salt_pepper(image, prob, rng=None, out=None):
+    """
+    Replaces pixels with probability prob by salt/pepper values. The values
+    come from Beta(0.5, 0.5) (sampled as sin^2(pi*u/2)) scaled to the dtype
+    range, and a replaced pixel gets the same value in all channels.
+    """
+    max_val = dtype_max(image)
+    if out is None:
+        out = image.copy()
+    elif out is not image:
+        np.copyto(out, image)
+
+    mask = uniform_samples(image.shape[:-1] if image.ndim > 2 else image.shape, rng)
+    mask = mask < prob
+    if is_rng_list(rng):
+        counts = np.count_nonzero(mask.reshape(len(rng), -1), axis=1)
+        values = np.concatenate(
+            [
+                uniform_samples((int(count),), image_rng)
+                for count, image_rng in zip(counts, rng)
+            ]
+        )
+    else:
+        values = uniform_samples((int(np.count_nonzero(mask)),), rng)
+    values *= np.float32(np.pi / 2)
+    np.sin(values, out=values)
+    np.square(values, out=values)
+    values *= max_val
+    np.rint(values, out=values)
+    values = values.astype(image.dtype)
+    out[mask] = values[:, None] if image.ndim > 2 else values
+    return out
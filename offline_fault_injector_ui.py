@@ -5,10 +5,62 @@ Offline Fault Injector For Camera FI Demo Tool
 """
 
 import os
-from os import listdir
-from os.path import isfile, join
 import random
+import shutil
+import hashlib
+import contextlib
+import threading
+import queue
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+import cv2
 from class_fi_offline_ui import OfflineImageFault as ofi
+from noise_kernels import image_rng
+from fi_manifest import FIManifest
+from fi_cache import FICache, size_parser
+from fi_pack import FIPack
+from image_codecs import codec_parser
+from fi_discovery import image_scanner, output_dir_creator
+from fi_queue import DEFAULT_LEASE_TIME, DEFAULT_QUEUE_BATCH, MAX_ATTEMPTS, FIQueue
+from fi_shards import (
+    DEFAULT_SHARD_SIZE,
+    ShardWriter,
+    sample_label,
+    shard_finder,
+    shard_image_scanner,
+    shard_sample_reader,
+    shard_stem,
+)
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# Linux FICLONE ioctl, shares the data blocks of two files (btrfs, xfs...)
+FICLONE = 0x40049409
+COPY_MODES = {"copy", "hardlink", "reflink"}
+EXECUTORS = ("auto", "thread", "process")
+# Faults that run in OpenCV calls (cv2.erode/dilate/morphologyEx, cv2.randn +
+# cv2.add), which release the GIL. Gaussian noise is drawn from the image
+# Generator, NumPy also releases the GIL while it fills the noise array.
+# Salt&pepper and Poisson index/mask arrays in NumPy while holding it.
+THREAD_FAULTS = {"e", "d", "gr", "g"}
+# Fault type names of the interface -> fault type codes of OfflineImageFault
+FAULT_TYPES = {
+    ## TOF Fault Types ##
+    "Gaussian": "g",
+    "Poisson": "p",
+    "Salt&Pepper": "s",
+    ## RGB Fault Types ##
+    "Open": "o",
+    "Close": "c",
+    "Dilation": "d",
+    "Erosion": "e",
+    "Gradient": "gr",
+    "Motion-blur": "m",
+    "Partialloss": "par",
+}
 
 # from class_list_creator import ListCreator as img_list
 
@@ -21,6 +73,30 @@ def main(
     randomized,
     fimp_rate,
     last_fi_name_list,
+    workers=1,
+    copy_mode=None,
+    batch_size=1,
+    stream_stages=None,
+    queue_depth=8,
+    seed=None,
+    manifest_dir="fi_manifests",
+    resume=False,
+    cache_dir=None,
+    cache_max_size=None,
+    pack_path=None,
+    tiling=None,
+    output_codec=None,
+    encode_threads=1,
+    recursive=False,
+    include=None,
+    exclude=None,
+    shard_input=False,
+    shard_size=None,
+    shard_index=0,
+    shard_count=1,
+    work_queue=None,
+    lease_time=DEFAULT_LEASE_TIME,
+    executor="auto",
 ):
     """
     Offline Camera Fault Injector UI module takes required variables from
@@ -28,184 +104,1577 @@ def main(
     which is used to print an fault in the offline method (the method where
     a fault is printed in a ready image folder and saved in another folder),
     compiles the appropriate fault types determined for TOF and RGB image types.
+
+    workers: Number of worker processes used by the offline engine. 1 keeps the
+    serial path, None uses all CPU cores.
+    copy_mode: How the images without fault are written to the output folder
+    in partial/randomized FI. None re-encodes them (old behaviour), "copy",
+    "hardlink" and "reflink" write them without decoding, so only the selected
+    images are processed.
+    batch_size: Number of images each worker reads before applying the fault.
+    Images of the same shape in a batch are faulted in one vectorized call.
+    stream_stages: (readers, fault workers, writers) thread counts of the
+    streaming reader -> fault -> writer pipeline (see image_stream_worker),
+    every count must be at least 1. None disables streaming.
+    queue_depth: Size of the bounded queues between the streaming stages.
+    seed: Run seed of the partial/randomized image selection and of the noise
+    faults (every image gets its own noise stream, see
+    noise_kernels.image_rng). When it is None, a new seed is created. The
+    seed is returned so that it can be logged and the same run, selection
+    and noise, can be repeated with any worker count, order or sharding.
+    manifest_dir: Folder of the run manifests (see fi_manifest.py), None
+    disables the manifest.
+    resume: Skips the images completed by an earlier run of the same plan.
+    When seed is None, the seed of that run is used again.
+    cache_dir: Folder of the faulty image cache (see fi_cache.py), outputs of
+    earlier runs with the same input, fault and seed are reused. None
+    disables the cache.
+    cache_max_size: Size limit of the cache in bytes or as a size like "10G"
+    (see fi_cache.size_parser), the least recently used outputs are evicted
+    after the run.
+    pack_path: Pack of the normal image folder (see fi_pack.py), the images
+    are read from its memory map instead of being decoded. None reads the
+    image files, as does a pack of another folder.
+    tiling: (tile size, thread count) of the tiled fault mode for very large
+    images (see OfflineImageFault.tiled_fault). Images are then processed one
+    by one, batch_size and stream_stages are not used. With pack_path the
+    memory of an image is bounded by its tiles, the faulty image is built in
+    a memory-mapped temporary file. None disables tiling.
+    output_codec: Codec of the outputs, e.g. "png:3", "webp", "tiff:lzw",
+    "bmp" (see image_codecs.py). None writes the format of the input images
+    with the OpenCV default parameters.
+    encode_threads: Encoder threads of every batch worker (batch_size > 1),
+    the streaming pipeline encodes on its writer threads.
+    recursive: Finds the images in the sub folders of ndir_name too, e.g.
+    robot/session/camera datasets. The outputs mirror the sub folders in
+    fdir_name. The files are only checked by their extension then.
+    include/exclude: Lists of globs of the relative image paths, e.g.
+    ["*/cam0/*.png"], ["*/calib/*"] (see fi_discovery.image_walker).
+    shard_input: ndir_name is a tar/zip shard or a folder of shards, the
+    images are streamed from the shards (see fi_shards.py). The outputs are
+    then always written into tar shards.
+    shard_size: Writes the outputs into tar shards of up to shard_size bytes
+    (image + JSON label per sample) instead of one file per image. The
+    manifest, the cache, the pack and tiling are not used with shards.
+    shard_index/shard_count: Splits the run across shard_count machines
+    without a coordinator, this machine processes the images of job shard
+    shard_index (0-based). The job shard of an image is a stable hash of its
+    name (relative path) and the seed (see job_shard_finder), the selection
+    is the same on all machines, so the union of the job shards writes
+    exactly the outputs of a single machine run. A seed is required.
+    work_queue: SQLite work queue file on a shared folder (see fi_queue.py).
+    The jobs are added to the queue and the workers of this machine lease
+    batches of batch_size jobs (DEFAULT_QUEUE_BATCH when batch_size is 1)
+    until the queue is drained; other machines join with queue_worker_runner.
+    The folder paths must be valid on every machine. The manifest, the cache,
+    the pack, tiling, streaming and shards are not used with a queue, a run
+    is resumed by starting it again with the same queue; when seed is None,
+    the seed stored in the queue is used again.
+    lease_time: Seconds after which the lease of a dead worker expires.
+    executor: "thread" runs the workers in a thread pool of this process
+    (no pickling, one copy of the pack/cache objects), "process" in a
+    process pool, "auto" chooses threads for OpenCV-only fault pipelines
+    (see executor_chooser). OpenCV's own threads are limited to
+    cpu_count // workers per pool worker.
+
+    Returns the result message, the image count, the faulty image name list
+    and the selection seed. With shard_count > 1, the image count and the
+    faulty image list are the ones of the job shard.
     """
+    if executor not in EXECUTORS:
+        raise ValueError("Unknown executor: " + str(executor))
+    if not 0 <= shard_index < shard_count:
+        raise ValueError(
+            "Job shard index must be in 0-"
+            + str(shard_count - 1)
+            + ": "
+            + str(shard_index)
+        )
+    if stream_stages is not None:
+        # A stage without threads would leave the pipeline waiting forever.
+        stream_stages = tuple(stream_stages)
+        if len(stream_stages) != 3 or min(stream_stages) < 1:
+            raise ValueError(
+                "Stream stages must be 3 thread counts of at least 1: "
+                + str(stream_stages)
+            )
+    run_options = {
+        "executor": executor,
+        "workers": workers,
+        "copy_mode": copy_mode,
+        "batch_size": batch_size,
+        "stream_stages": stream_stages,
+        "queue_depth": queue_depth,
+    }
+    if pack_path is not None:
+        run_options["image_pack"] = FIPack(pack_path)
+    if tiling is not None:
+        run_options["tiling"] = tuple(tiling)
 
-    img_format = str(img_format_finder(ndir_name))
-    img_name_list = read_image_list(ndir_name)
+    if shard_input:
+        img_sources = shard_image_scanner(shard_finder(ndir_name))
+        img_formats = {img: img_sources[img][0] for img in img_sources}
+        run_options["img_sources"] = {img: img_sources[img][1] for img in img_sources}
+        if shard_size is None:
+            shard_size = DEFAULT_SHARD_SIZE
+    else:
+        # The image paths are ndir_name + image name + image format.
+        ndir_name = os.path.join(ndir_name, "")
+        # Every image keeps its own format, the folder is listed only once.
+        img_formats = image_scanner(ndir_name, recursive, include, exclude)
+        image_pack = run_options.get("image_pack")
+        if image_pack is not None and os.path.realpath(
+            image_pack.ndir_name
+        ) != os.path.realpath(ndir_name):
+            # The pack entries are found by image name, a pack of another
+            # folder would give the images of that folder.
+            print(
+                "The pack was built from "
+                + image_pack.ndir_name
+                + ", the images are decoded."
+            )
+            run_options.pop("image_pack")
+    if shard_size is not None:
+        if work_queue is not None:
+            raise ValueError("A work queue run cannot write tar shards.")
+        run_options["shard_size"] = int(shard_size)
+        run_options.pop("image_pack", None)
+        run_options.pop("tiling", None)
+        manifest_dir = cache_dir = None
+    if work_queue is not None:
+        run_options["work_queue"] = FIQueue(work_queue, lease_time)
+        run_options["stream_stages"] = None
+        run_options.pop("image_pack", None)
+        run_options.pop("tiling", None)
+        manifest_dir = cache_dir = None
+    out_format = None
+    if output_codec is not None:
+        run_options["output_codec"] = codec_parser(output_codec, None)
+        run_options["encode_threads"] = encode_threads
+        out_format = run_options["output_codec"][0]
+        if out_format is not None and copy_mode is not None:
+            if any(img_format != out_format for img_format in img_formats.values()):
+                # A copied normal image would keep the input format.
+                print("copy_mode cannot be used when the output format changes.")
+                copy_mode = run_options["copy_mode"] = None
+    img_name_list = list(img_formats)
     # Eger tekrarlı hata enj olursa hata uygulanmıs resimler, ana listeden
     # cikarilarak img_name_list olusturulur.
     if last_fi_name_list is not None:
         img_name_list = list_substractor(img_name_list, last_fi_name_list)
 
-    fault_rate = int(fault_rate) / 100
-    fimp_val = int(int(len(img_name_list)) * int(fimp_rate) / 100)
-    random_value = 0
-
-    ## TOF Fault Types##
-    if fault_type == "Gaussian":
-        fault_type = "g"
-    elif fault_type == "Poisson":
-        fault_type = "p"
-    elif fault_type == "Salt&Pepper":
-        fault_type = "s"
-    ## RGB Fault Types ##
-    elif fault_type == "Open":
-        fault_type = "o"
-    elif fault_type == "Close":
-        fault_type = "c"
-    elif fault_type == "Dilation":
-        fault_type = "d"
-    elif fault_type == "Erosion":
-        fault_type = "e"
-    elif fault_type == "Gradient":
-        fault_type = "gr"
-    elif fault_type == "Motion-blur":
-        fault_type = "m"
-    elif fault_type == "Partialloss":
-        fault_type = "par"
-    else:
-        pass
+    if fault_rate is not None:
+        fault_rate = int(fault_rate) / 100
 
-    fi_image_name_list = []
+    fault_type = fault_plan_converter(fault_type)
 
-    if randomized is False:
-        if fimp_rate != 100:
-            fi_image_name_list = random_fault_applier(
-                img_name_list,
-                ndir_name,
-                fdir_name,
-                img_format,
-                fault_type,
-                fault_rate,
-                fimp_val,
-            )
-            done = (
-                "Partial Injection Completed!\nFault Injected Image Value: "
-                + str(fimp_val)
-                + "/"
-                + str(len(img_name_list))
-            )
-            fi_image_name_list.sort()
-        else:
-            multi_fault_applier(
-                img_name_list, ndir_name, fdir_name, img_format, fault_type, fault_rate
-            )
-            done = "Full Injection Completed! Fault applied to all images."
+    manifest = None
+    if manifest_dir is not None:
+        fi_plan = {
+            "ndir_name": os.path.abspath(ndir_name),
+            "fdir_name": os.path.abspath(fdir_name),
+            "fault_type": fault_type,
+            "fault_rate": fault_rate,
+            "fimp_rate": int(fimp_rate),
+            "randomized": randomized,
+            "copy_mode": copy_mode,
+            "output_codec": output_codec,
+            "excluded": sorted(last_fi_name_list or []),
+        }
+        if recursive or include or exclude:
+            fi_plan["discovery"] = [recursive, include, exclude]
+        if run_options.get("tiling") is not None:
+            # The tiled noise faults have one noise stream per tile.
+            fi_plan["tile_size"] = run_options["tiling"][0]
+        if shard_count > 1:
+            fi_plan["job_shard"] = [shard_index, shard_count]
+        manifest = FIManifest(manifest_dir, fi_plan, ndir_name, fdir_name, out_format)
+        if resume and seed is None:
+            seed = manifest.last_seed()
+    if seed is None and work_queue is not None:
+        # A restarted queue run uses the seed stored in the queue again.
+        queue_info = run_options["work_queue"].run_info()
+        if queue_info is not None:
+            seed = queue_info["noise_seed"]
+    seed = run_seed_finder(seed, shard_count)
+    selection_rng = random.Random(seed)
+    run_options["noise_seed"] = seed
+    if shard_count > 1:
+        run_options["job_shard"] = (shard_index, shard_count, seed)
+    if manifest is not None:
+        manifest.start(seed, resume)
+        run_options["manifest"] = manifest
+    fi_cache = None
+    if cache_dir is not None:
+        if cache_max_size is not None:
+            cache_max_size = size_parser(cache_max_size)
+        fi_cache = FICache(cache_dir, cache_max_size, seed)
+        run_options["fi_cache"] = fi_cache
+
+    if shard_size is None:
+        output_dir_creator(fdir_name, img_name_list)
+    if randomized and fimp_rate != 100:
+        print(
+            "Randomized function cannot be applicable Fault Implementation Value type FI!"
+        )
+    # The selection is completed before any image is processed, so that the
+    # faulty image list can be shared with the workers.
+    fi_image_name_list, fimp_val = fault_image_selector(
+        img_name_list, randomized, fimp_rate, selection_rng
+    )
+
+    if not randomized and fimp_rate == 100:
+        multi_fault_applier(
+            img_name_list,
+            ndir_name,
+            fdir_name,
+            img_formats,
+            fault_type,
+            fault_rate,
+            **run_options,
+        )
+        done = injection_message(randomized, fimp_rate, 0, 0, seed)
+        fi_image_name_list = []
     else:
-        if fimp_rate != 100:
-            print(
-                "Randomized function cannot be applicable Fault Implementation Value type FI!"
-            )
-        length = len(img_name_list)
-        random_value = random.randrange(length)
-        fi_image_name_list = random_fault_applier(
+        random_fault_applier(
             img_name_list,
             ndir_name,
             fdir_name,
-            img_format,
+            img_formats,
             fault_type,
             fault_rate,
-            random_value,
+            fi_image_name_list,
+            **run_options,
+        )
+        done = injection_message(
+            randomized, fimp_rate, fimp_val, len(img_name_list), seed
+        )
+        fi_image_name_list.sort()
+
+    if manifest is not None:
+        manifest.close()
+    if fi_cache is not None:
+        fi_cache.prune()
+
+    if shard_count > 1:
+        img_name_list = job_shard_filter(img_name_list, shard_index, shard_count, seed)
+        fi_image_name_list = job_shard_filter(
+            fi_image_name_list, shard_index, shard_count, seed
+        )
+        done = job_shard_message(done, shard_index, shard_count, len(img_name_list))
+
+    return done, len(img_name_list), fi_image_name_list, seed
+
+
+def sweep_main(
+    ndir_name,
+    variants,
+    randomized,
+    fimp_rate,
+    last_fi_name_list,
+    workers=1,
+    copy_mode=None,
+    output_codec=None,
+    recursive=False,
+    include=None,
+    exclude=None,
+    shard_size=None,
+    shard_index=0,
+    shard_count=1,
+    executor="auto",
+):
+    """
+    Single pass sweep: runs several FI variants of one normal image folder,
+    variants is a list of (fdir_name, fault_type, fault_rate, seed). The
+    folder is listed once and every image is read and decoded once for all
+    variants (once per TOF/RGB reader), then each variant's output is
+    written to its own folder, or to its own tar shards with shard_size.
+    The images of every variant are selected exactly like main() does with
+    the same seed, so a sweep writes the same outputs as one main() run per
+    variant. The manifest, the cache, the pack, tiling, batches and
+    streaming are not used. shard_index/shard_count split the sweep into job
+    shards like main(), every variant with its own seed. executor is the
+    pool of the workers like main(), "auto" chooses threads when all
+    variants are OpenCV-only.
+
+    Returns a (result message, image count, faulty image name list,
+    selection seed) tuple per variant, like main().
+    """
+    ndir_name = os.path.join(ndir_name, "")
+    img_formats = image_scanner(ndir_name, recursive, include, exclude)
+    if output_codec is not None:
+        output_codec = codec_parser(output_codec, None)
+        out_format = output_codec[0]
+        if out_format is not None and copy_mode is not None:
+            if any(img_format != out_format for img_format in img_formats.values()):
+                print("copy_mode cannot be used when the output format changes.")
+                copy_mode = None
+    img_name_list = list(img_formats)
+    if last_fi_name_list is not None:
+        img_name_list = list_substractor(img_name_list, last_fi_name_list)
+    if randomized and fimp_rate != 100:
+        print(
+            "Randomized function cannot be applicable Fault Implementation Value type FI!"
         )
-        done = (
+
+    results = []
+    sweep_variants = []
+    # Indices of the variants that write/fault an image
+    image_variants = {img_name: [] for img_name in img_name_list}
+    faulty_variants = {img_name: [] for img_name in img_name_list}
+    for index, (fdir_name, fault_type, fault_rate, seed) in enumerate(variants):
+        if fault_rate is not None:
+            fault_rate = int(fault_rate) / 100
+        seed = run_seed_finder(seed, shard_count)
+        fi_image_name_list, fimp_val = fault_image_selector(
+            img_name_list, randomized, fimp_rate, random.Random(seed)
+        )
+        if not randomized and fimp_rate == 100:
+            done_list = []  # full injection, like main()
+        else:
+            done_list = fi_image_name_list
+        done = injection_message(
+            randomized, fimp_rate, fimp_val, len(img_name_list), seed
+        )
+        variant_images = img_name_list
+        if shard_count > 1:
+            variant_images = job_shard_filter(
+                img_name_list, shard_index, shard_count, seed
+            )
+            fi_image_name_list = job_shard_filter(
+                fi_image_name_list, shard_index, shard_count, seed
+            )
+            done_list = job_shard_filter(done_list, shard_index, shard_count, seed)
+            done = job_shard_message(
+                done, shard_index, shard_count, len(variant_images)
+            )
+        for img_name in variant_images:
+            image_variants[img_name].append(index)
+        for img_name in fi_image_name_list:
+            faulty_variants[img_name].append(index)
+        results.append((done, len(variant_images), sorted(done_list), seed))
+        sweep_variants.append(
+            (fdir_name, fault_plan_converter(fault_type), fault_rate, seed)
+        )
+
+        os.makedirs(fdir_name, exist_ok=True)
+        if shard_size is None:
+            output_dir_creator(fdir_name, variant_images)
+
+    sweep_jobs = [
+        (
+            img_name,
+            img_formats[img_name],
+            tuple(image_variants[img_name]),
+            tuple(faulty_variants[img_name]),
+        )
+        for img_name in img_name_list
+        if image_variants[img_name]
+    ]
+    if workers is None:
+        workers = os.cpu_count() or 1
+    worker = partial(
+        sweep_fault_worker,
+        ndir_name,
+        copy_mode,
+        output_codec,
+        shard_size,
+        sweep_variants,
+    )
+    sweep_pipeline = []
+    for _, fault_type, fault_rate, _ in sweep_variants:
+        if isinstance(fault_type, list):
+            sweep_pipeline.extend(fault_type)
+        else:
+            sweep_pipeline.append((fault_type, fault_rate))
+    executor = executor_chooser(sweep_pipeline, executor)
+    # One (output shard prefix, jobs) share per worker
+    sweep_jobs = shard_job_splitter(sweep_jobs, workers)
+    if shard_count > 1:
+        sweep_jobs = [
+            (job_shard_prefix(prefix, shard_index), jobs) for prefix, jobs in sweep_jobs
+        ]
+    if workers <= 1 or len(sweep_jobs) <= 1:
+        for sweep_job in sweep_jobs:
+            worker(sweep_job)
+    else:
+        with worker_pool(executor, workers) as pool:
+            list(pool.map(worker, sweep_jobs))
+
+    return results
+
+
+def run_seed_finder(seed, shard_count=1):
+    """
+    Seed of a run: the given seed, or a new one when it is None. Raises
+    ValueError when a run split into job shards has no seed, every machine
+    must select the same images.
+    """
+    if seed is not None:
+        return seed
+    if shard_count > 1:
+        raise ValueError("A seed is required to split a run into job shards.")
+    return random.SystemRandom().randrange(2**32)
+
+
+def job_shard_finder(img_name, seed, shard_count):
+    """
+    Job shard of an image: a stable hash (BLAKE2b) of the image name, the
+    relative path with "/" separators, and the run seed. It does not depend
+    on the machine, the Python hash seed or the order of the images.
+    """
+    digest = hashlib.blake2b(
+        (str(seed) + ":" + img_name).encode("utf-8"), digest_size=8
+    ).digest()
+    return int.from_bytes(digest, "big") % shard_count
+
+
+def job_shard_filter(img_names, shard_index, shard_count, seed):
+    """The image names of job shard shard_index, in their order."""
+    return [
+        img_name
+        for img_name in img_names
+        if job_shard_finder(img_name, seed, shard_count) == shard_index
+    ]
+
+
+def job_shard_message(done, shard_index, shard_count, img_count):
+    """Result message of a job shard run."""
+    return (
+        done
+        + "\nJob Shard: "
+        + str(shard_index + 1)
+        + "/"
+        + str(shard_count)
+        + " ("
+        + str(img_count)
+        + " images)"
+    )
+
+
+def job_shard_prefix(prefix, shard_index):
+    """Output tar shard prefix of a job shard, the machines never share a name."""
+    return prefix + "-node" + str(shard_index).zfill(4)
+
+
+def fault_image_selector(img_name_list, randomized, fimp_rate, selection_rng):
+    """
+    Faulty images of a run with the selection of main(): all images, fimp_rate
+    % of the images, or a random number of images when randomized. Returns
+    the faulty image names and the selected image count.
+    """
+    if randomized:
+        fimp_val = selection_rng.randrange(len(img_name_list))
+    elif fimp_rate != 100:
+        fimp_val = int(int(len(img_name_list)) * int(fimp_rate) / 100)
+    else:
+        return list(img_name_list), 0
+    return random_image_selector(img_name_list, fimp_val, selection_rng), fimp_val
+
+
+def sweep_fault_worker(
+    ndir_name, copy_mode, output_codec, shard_size, variants, sweep_job
+):
+    """
+    Worker unit of sweep_main. sweep_job is an (output shard prefix, jobs)
+    share, a job is an (image name, image format, indices of the variants
+    that write the image, indices of the variants that fault the image)
+    tuple and variants are (fdir_name, fault type, fault rate, seed) tuples.
+    Every image is read once and decoded at most once per reader; the images
+    without fault are copied with copy_mode, or stored without decoding in
+    the shards, when their format does not change.
+    """
+    prefix, sweep_jobs = sweep_job
+    codec_params = [] if output_codec is None else output_codec[1]
+    with contextlib.ExitStack() as writer_stack:
+        shard_writers = None
+        if shard_size is not None:
+            shard_writers = [
+                writer_stack.enter_context(ShardWriter(fdir_name, prefix, shard_size))
+                for fdir_name, _, _, _ in variants
+            ]
+        for img_name, img_format, variant_indices, faulty_indices in sweep_jobs:
+            img_path = ndir_name + img_name + img_format
+            out_format = output_format_finder(img_format, output_codec)
+            try:
+                with open(img_path, "rb") as image_file:
+                    data = image_file.read()
+            except OSError as error_msg:
+                print(error_msg)
+                continue
+            decoded_images = {}  # TOF reader: True, RGB reader: False
+            for index in variant_indices:
+                fdir_name, fault_type, fault_rate, seed = variants[index]
+                img_fault_type = fault_type if index in faulty_indices else "nf"
+                tof_fault = ofi.tof_fault_check(fault_type)
+                try:
+                    if img_fault_type == "nf" and out_format == img_format:
+                        if shard_writers is not None:
+                            shard_writers[index].write(
+                                img_name,
+                                {
+                                    out_format: data,
+                                    ".json": sample_label(
+                                        img_name, img_format, ndir_name, "nf", None
+                                    ),
+                                },
+                            )
+                            continue
+                        if copy_mode is not None:
+                            image_copier(
+                                img_path,
+                                os.path.join(fdir_name, img_name + out_format),
+                                copy_mode,
+                            )
+                            continue
+                    if tof_fault not in decoded_images:
+                        decoded_images[tof_fault] = (
+                            ofi.tof_decoder(data)
+                            if tof_fault
+                            else ofi.cv2_decoder(data)
+                        )
+                    image = decoded_images[tof_fault]
+                    if image is None:
+                        raise IOError("Image cannot be decoded: " + img_path)
+                    if img_fault_type != "nf":
+                        # image_fault does not change the shared decoded image.
+                        image = ofi.image_fault(
+                            image,
+                            img_fault_type,
+                            fault_rate,
+                            image_rng_finder(seed, img_name, img_fault_type),
+                        )
+                    if tof_fault:
+                        image = ofi.gray_converter(image)
+                    if shard_writers is not None:
+                        encoded, encoded_image = cv2.imencode(
+                            out_format, image, codec_params
+                        )
+                        if not encoded:
+                            raise IOError("Image cannot be encoded to " + out_format)
+                        shard_writers[index].write(
+                            img_name,
+                            {
+                                out_format: encoded_image.tobytes(),
+                                ".json": sample_label(
+                                    img_name,
+                                    img_format,
+                                    ndir_name,
+                                    img_fault_type,
+                                    fault_rate,
+                                ),
+                            },
+                        )
+                    else:
+                        output_path = os.path.join(fdir_name, img_name + out_format)
+                        output_unlinker(output_path)
+                        cv2.imwrite(output_path, image, codec_params)
+                except Exception as error_msg:
+                    print(error_msg)
+
+
+def injection_message(randomized, fimp_rate, fimp_val, img_count, seed):
+    """Result message of an offline FI run."""
+    if randomized:
+        return (
             "Randomized Injection Sequence Completed!\n"
             + "----------------------------------\nFault Injected Image Value: "
-            + str(random_value)
+            + str(fimp_val)
             + "/"
-            + str(len(img_name_list))
+            + str(img_count)
+            + "\nSelection Seed: "
+            + str(seed)
         )
-        fi_image_name_list.sort()
+    if fimp_rate != 100:
+        return (
+            "Partial Injection Completed!\nFault Injected Image Value: "
+            + str(fimp_val)
+            + "/"
+            + str(img_count)
+            + "\nSelection Seed: "
+            + str(seed)
+        )
+    return "Full Injection Completed! Fault applied to all images."
 
-    return done, len(img_name_list), fi_image_name_list
 
+def fault_plan_converter(fault_type):
+    """
+    Converts an interface fault type, or a list of (fault type, fault rate %)
+    pairs, to the fault type codes of OfflineImageFault. A list is an ordered
+    fault pipeline, e.g. [("Gaussian", 10), ("Erosion", 15)], applied with one
+    read and one write per image.
+    """
+    if isinstance(fault_type, (list, tuple)):
+        return [
+            (fault_type_converter(pipe_type), int(pipe_rate) / 100)
+            for pipe_type, pipe_rate in fault_type
+        ]
+    return fault_type_converter(fault_type)
 
-def list_substractor(norm_img_list, fi_img_list):
-    """Liste ayırıcı"""
-    return [x for x in norm_img_list if x not in fi_img_list]
+
+def fault_type_converter(fault_type):
+    """
+    Converts the fault type names of the interface (FAULT_TYPES) to the fault
+    type codes of OfflineImageFault, codes are returned as they are.
+    """
+    return FAULT_TYPES.get(fault_type, fault_type)
 
 
-def read_image_list(file_path):
+def list_substractor(norm_img_list, fi_img_list):
     """
-    TOF saves the names of the images in the Image folder in a list.
+    Liste ayırıcı. Removes the names in fi_img_list from norm_img_list and
+    keeps the order of norm_img_list. The excluded names are kept in a set,
+    so this is O(n + m) instead of O(n * m).
     """
-    onlyfiles = [f for f in listdir(file_path) if isfile(join(file_path, f))]
-    image_list = [i.split(".", 1)[0] for i in onlyfiles]
-    return image_list
+    excluded_names = set(fi_img_list)
+    return [x for x in norm_img_list if x not in excluded_names]
 
 
 def multi_fault_applier(
-    img_name_list, ndir_name, fdir_name, img_format, fault_type, fault_rate
+    img_name_list,
+    ndir_name,
+    fdir_name,
+    img_formats,
+    fault_type,
+    fault_rate,
+    **run_options,
 ):
     """
-    Allows multiple faults to be applied to a list of images.
+    Allows multiple faults to be applied to a list of images. img_formats is
+    the {image name: image format} dict of fi_discovery.image_scanner,
+    run_options are the execution options of fault_job_runner.
     """
-    for i, img in enumerate(img_name_list):
-        image_name = [i, img]
-        apply_fault = ofi(
-            ndir_name, fdir_name, image_name[1], img_format, fault_type, fault_rate
-        )
-
-        apply_fault.main()
+    fault_jobs = [(img, fault_type, img_formats[img]) for img in img_name_list]
+    fault_job_runner(
+        fault_jobs,
+        ndir_name,
+        fdir_name,
+        fault_type,
+        fault_rate,
+        **run_options,
+    )
 
 
 def random_fault_applier(
     img_name_list,
     ndir_name,
     fdir_name,
-    img_format,
+    img_formats,
     fault_type,
     fault_rate,
-    random_value,
+    fi_image_name_list,
+    **run_options,
 ):
     """
     It is a test function for injecting faults on a random number of images.
+    fi_image_name_list are the images selected by fault_image_selector,
+    run_options are the execution options of fault_job_runner.
     """
-    fi_image_name_list = []
+    if (
+        run_options.get("copy_mode") is None
+        and run_options.get("shard_size") is None
+        and run_options.get("work_queue") is None
+    ):
+        # All images are first written to the output folder without fault ("nf"),
+        # then the selected images are overwritten with their faulty versions.
+        normal_jobs = [(img, "nf", img_formats[img]) for img in img_name_list]
+        fault_job_runner(
+            normal_jobs,
+            ndir_name,
+            fdir_name,
+            fault_type,
+            fault_rate,
+            **run_options,
+        )
+        fault_jobs = [(img, fault_type, img_formats[img]) for img in fi_image_name_list]
+    else:
+        # Single pass: the images without fault are copied/linked, the selected
+        # images are read and written only once.
+        selected_images = set(fi_image_name_list)
+        fault_jobs = [
+            (img, fault_type if img in selected_images else "nf", img_formats[img])
+            for img in img_name_list
+        ]
+    fault_job_runner(
+        fault_jobs,
+        ndir_name,
+        fdir_name,
+        fault_type,
+        fault_rate,
+        **run_options,
+    )
+
+    return fi_image_name_list
+
+
+def random_image_selector(img_name_list, random_value, selection_rng=None):
+    """
+    Selects exactly random_value different images from the image list for
+    random fault injection in O(n). The selection is repeatable with a seeded
+    selection_rng (random.Random).
+    """
+    if selection_rng is None:
+        selection_rng = random.Random()
+    random_value = min(random_value, len(img_name_list))
+
+    return selection_rng.sample(img_name_list, random_value)
+
+
+def image_fault_worker(
+    ndir_name,
+    fdir_name,
+    fault_type,
+    fault_rate,
+    copy_mode,
+    fi_cache,
+    image_pack,
+    output_codec,
+    fault_job,
+    tiling=None,
+    noise_seed=None,
+):
+    """
+    Worker unit of the offline engine. Reads, faults and writes one image and
+    sends back only the image name and whether it is written. fault_job is an
+    (image name, fault type, image format) tuple, the fault type of the job
+    is "nf" for the images written without fault. With fi_cache
+    (fi_cache.FICache), cached outputs are linked/copied instead of being
+    computed again. With image_pack (fi_pack.FIPack), the packed images are
+    not decoded again.
+    tiling is the (tile size, thread count) of the tiled fault mode.
+    noise_seed is the run seed of the noise streams (see image_rng_finder).
+    """
+    img_name, img_fault_type, img_format = fault_job
+    output_path = output_path_finder(fdir_name, img_name, img_format, output_codec)
+
+    if img_fault_type == "nf" and copy_mode is not None:
+        return img_name, image_copier(
+            ndir_name + img_name + img_format, output_path, copy_mode
+        )
+
+    cache_hit, cache_key = cache_lookup(
+        fi_cache,
+        ndir_name,
+        fdir_name,
+        img_name,
+        img_format,
+        img_fault_type,
+        fault_type,
+        fault_rate,
+        output_codec,
+        tiling,
+    )
+    if cache_hit:
+        return img_name, True
+
+    output_unlinker(output_path)
+    apply_fault = ofi(
+        ndir_name,
+        fdir_name,
+        img_name,
+        img_format,
+        img_fault_type,
+        fault_rate,
+        image_pack,
+        tiling,
+        output_codec=output_codec,
+        rng=image_rng_finder(noise_seed, img_name, img_fault_type),
+    )
+
+    if img_fault_type != "nf":
+        done = apply_fault.main()
+    elif ofi.tof_fault_check(fault_type):
+        done = apply_fault.tof_image_fault()
+    else:
+        done = apply_fault.rgb_image_fault()
+
+    if done and cache_key is not None:
+        fi_cache.store(cache_key, output_path)
+    return img_name, bool(done)
+
 
-    for i, img in enumerate(img_name_list):
-        image_name = [i, img]
+def image_batch_fault_worker(
+    ndir_name,
+    fdir_name,
+    fault_type,
+    fault_rate,
+    copy_mode,
+    fi_cache,
+    image_pack,
+    output_codec,
+    fault_jobs,
+    encode_threads=1,
+    noise_seed=None,
+):
+    """
+    Batch version of image_fault_worker. Reads all images of the jobs, groups
+    the images to be faulted by shape and applies the fault to every group
+    with one OfflineImageFault.batch_fault call, then writes them. With
+    encode_threads > 1 the images are encoded on a thread pool.
+    """
+    tof_fault = ofi.tof_fault_check(fault_type)
+    shape_groups = {}
+    done_images = {}
+    cache_keys = {}
+    write_jobs = []
+
+    for img_name, img_fault_type, img_format in fault_jobs:
+        output_path = output_path_finder(fdir_name, img_name, img_format, output_codec)
+        if img_fault_type == "nf" and copy_mode is not None:
+            done_images[img_name] = image_copier(
+                ndir_name + img_name + img_format, output_path, copy_mode
+            )
+            continue
+
+        cache_hit, cache_key = cache_lookup(
+            fi_cache,
+            ndir_name,
+            fdir_name,
+            img_name,
+            img_format,
+            img_fault_type,
+            fault_type,
+            fault_rate,
+            output_codec,
+        )
+        if cache_hit:
+            done_images[img_name] = True
+            continue
+        cache_keys[img_name] = (cache_key, output_path)
+
+        output_unlinker(output_path)
         apply_fault = ofi(
-            ndir_name, fdir_name, image_name[1], img_format, "nf", fault_rate
+            ndir_name,
+            fdir_name,
+            img_name,
+            img_format,
+            img_fault_type,
+            fault_rate,
+            image_pack,
+            output_codec=output_codec,
+            rng=image_rng_finder(noise_seed, img_name, img_fault_type),
         )
+        try:
+            if tof_fault:
+                image = apply_fault.tof_image_reader()
+            else:
+                image = apply_fault.rgb_image_reader()
+        except Exception as error_msg:
+            print(error_msg)
+            continue
 
-        if fault_type in {"s", "g", "p"}:
-            apply_fault.tof_image_fault()
+        if img_fault_type == "nf":
+            write_jobs.append((apply_fault, image))
         else:
-            apply_fault.rgb_image_fault()
+            group_key = (image.shape, image.dtype.str)
+            shape_groups.setdefault(group_key, []).append((apply_fault, image))
+
+    for group in shape_groups.values():
+        try:
+            # Every image keeps its own noise stream in the batch.
+            rngs = [apply_fault.rng for apply_fault, _ in group]
+            faulty_images = ofi.batch_fault(
+                [image for _, image in group],
+                fault_type,
+                fault_rate,
+                None if None in rngs else rngs,
+            )
+        except Exception as error_msg:
+            print(error_msg)
+            continue
+        for (apply_fault, _), faulty_image in zip(group, faulty_images):
+            write_jobs.append((apply_fault, faulty_image))
+
+    done_images.update(image_encoder(write_jobs, tof_fault, encode_threads))
+
+    for img_name, (cache_key, output_path) in cache_keys.items():
+        if cache_key is not None and done_images.get(img_name):
+            fi_cache.store(cache_key, output_path)
 
-    i_val = 0
-    y_val = 0
+    return [(job[0], done_images.get(job[0], False)) for job in fault_jobs]
 
-    while i_val != random_value:
-        x_val = random.randint(1, 4)
-        image_name = img_name_list[y_val]
 
-        if x_val % 2 == 0:
-            apply_fault = ofi(
-                ndir_name, fdir_name, image_name, img_format, fault_type, fault_rate
+def image_stream_worker(
+    ndir_name,
+    fdir_name,
+    fault_type,
+    fault_rate,
+    copy_mode,
+    fi_cache,
+    image_pack,
+    output_codec,
+    stream_stages,
+    queue_depth,
+    fault_jobs,
+    noise_seed=None,
+):
+    """
+    Streaming version of image_fault_worker. Reader, fault and writer threads
+    are connected by bounded queues, so reading, fault computation and writing
+    of different images overlap. At most about 2 * queue_depth images are kept
+    in memory. stream_stages is the (readers, fault workers, writers) count.
+    """
+    readers, fault_workers, writers = stream_stages
+    tof_fault = ofi.tof_fault_check(fault_type)
+    done_images = {}
+    cache_keys = {}
+    job_queue = queue.Queue()
+    read_queue = queue.Queue(maxsize=queue_depth)
+    write_queue = queue.Queue(maxsize=queue_depth)
+    for fault_job in fault_jobs:
+        job_queue.put(fault_job)
+
+    def reader():
+        while True:
+            try:
+                img_name, img_fault_type, img_format = job_queue.get_nowait()
+            except queue.Empty:
+                return
+            output_path = output_path_finder(
+                fdir_name, img_name, img_format, output_codec
             )
-            fi_image_name_list.append(image_name)
+            try:
+                if img_fault_type == "nf" and copy_mode is not None:
+                    done_images[img_name] = image_copier(
+                        ndir_name + img_name + img_format, output_path, copy_mode
+                    )
+                    continue
+                cache_hit, cache_key = cache_lookup(
+                    fi_cache,
+                    ndir_name,
+                    fdir_name,
+                    img_name,
+                    img_format,
+                    img_fault_type,
+                    fault_type,
+                    fault_rate,
+                    output_codec,
+                )
+                if cache_hit:
+                    done_images[img_name] = True
+                    continue
+                cache_keys[img_name] = (cache_key, output_path)
+                output_unlinker(output_path)
+                apply_fault = ofi(
+                    ndir_name,
+                    fdir_name,
+                    img_name,
+                    img_format,
+                    img_fault_type,
+                    fault_rate,
+                    image_pack,
+                    output_codec=output_codec,
+                    rng=image_rng_finder(noise_seed, img_name, img_fault_type),
+                )
+                if tof_fault:
+                    image = apply_fault.tof_image_reader()
+                else:
+                    image = apply_fault.rgb_image_reader()
+            except Exception as error_msg:
+                print(error_msg)
+                continue
+            read_queue.put((apply_fault, image))
 
-            if fault_type in {"s", "g", "p"}:
-                apply_fault.tof_image_fault()
-            else:
-                apply_fault.rgb_image_fault()
+    def fault_worker():
+        while True:
+            item = read_queue.get()
+            if item is None:
+                return
+            apply_fault, image = item
+            if apply_fault.fault_type != "nf":
+                try:
+                    image = ofi.image_fault(
+                        image,
+                        apply_fault.fault_type,
+                        apply_fault.fault_rate,
+                        apply_fault.rng,
+                    )
+                except Exception as error_msg:
+                    print(error_msg)
+                    continue
+            write_queue.put((apply_fault, image))
 
-            i_val += 1
-        y_val += 1
+    def writer():
+        while True:
+            item = write_queue.get()
+            if item is None:
+                return
+            apply_fault, image = item
+            img_name = apply_fault.img_name
+            done_images[img_name] = image_writer(apply_fault, image, tof_fault)
+            cache_key, output_path = cache_keys.get(img_name, (None, None))
+            if done_images[img_name] and cache_key is not None:
+                fi_cache.store(cache_key, output_path)
 
-        if y_val >= len(img_name_list):
-            y_val = 0
+    stage_threads = []
+    for stage, count in (
+        (reader, readers),
+        (fault_worker, fault_workers),
+        (writer, writers),
+    ):
+        threads = [threading.Thread(target=stage, daemon=True) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        stage_threads.append(threads)
 
-    return fi_image_name_list
+    # Every stage is closed with one None per thread of the next stage.
+    for threads, next_queue, next_count in zip(
+        stage_threads, (read_queue, write_queue), (fault_workers, writers)
+    ):
+        for thread in threads:
+            thread.join()
+        for _ in range(next_count):
+            next_queue.put(None)
+    for thread in stage_threads[2]:
+        thread.join()
+
+    return [(job[0], done_images.get(job[0], False)) for job in fault_jobs]
 
 
-def img_format_finder(ndir_name):
+def cache_lookup(
+    fi_cache,
+    ndir_name,
+    fdir_name,
+    img_name,
+    img_format,
+    img_fault_type,
+    fault_type,
+    fault_rate,
+    output_codec,
+    tiling=None,
+):
     """
-    This function reads the format of the images taken from the normal
-    image database, and the faulty images are output in the same format.
+    Looks up the output of a job in the faulty image cache and writes it to
+    the output folder on a hit. Returns (hit, cache key of the job). The
+    noise of a tiled noise fault depends on the tile size (one noise stream
+    per tile), the tile size is then a part of the key.
     """
-    one_image = os.listdir(ndir_name)[0]
-    img_format = "." + one_image.split(".", 2)[1]
+    if fi_cache is None:
+        return False, None
+    noise_fault = ofi.noise_fault_check(img_fault_type)
+    try:
+        cache_key = fi_cache.image_key(
+            ndir_name + img_name + img_format,
+            img_fault_type,
+            fault_type,
+            fault_rate,
+            output_format_finder(img_format, output_codec),
+            None if output_codec is None else output_codec[1],
+            img_name if noise_fault else None,
+            tiling[0] if noise_fault and tiling is not None else None,
+        )
+    except OSError:
+        return False, None
+    output_path = output_path_finder(fdir_name, img_name, img_format, output_codec)
+    return fi_cache.materialize(cache_key, output_path), cache_key
+
 
+def output_format_finder(img_format, output_codec=None):
+    """
+    Output format of an image of img_format, output_codec is the (output
+    format, cv2.imwrite parameters) of image_codecs.codec_parser. The output
+    format None keeps the format of the image.
+    """
+    if output_codec is not None and output_codec[0] is not None:
+        return output_codec[0]
     return img_format
+
+
+def output_path_finder(fdir_name, img_name, img_format, output_codec=None):
+    """Output path of an image, see output_format_finder."""
+    return os.path.join(
+        fdir_name, img_name + output_format_finder(img_format, output_codec)
+    )
+
+
+def image_encoder(write_jobs, tof_fault, encode_threads=1):
+    """
+    Writes the (OfflineImageFault, image) pairs of write_jobs, on a thread
+    pool when encode_threads > 1 (OpenCV releases the GIL while encoding).
+    Returns {image name: written}.
+    """
+    if encode_threads <= 1 or len(write_jobs) <= 1:
+        written = [image_writer(*write_job, tof_fault) for write_job in write_jobs]
+    else:
+        with ThreadPoolExecutor(max_workers=encode_threads) as executor:
+            written = list(
+                executor.map(
+                    lambda write_job: image_writer(*write_job, tof_fault), write_jobs
+                )
+            )
+    return {
+        apply_fault.img_name: done
+        for (apply_fault, _), done in zip(write_jobs, written)
+    }
+
+
+def image_writer(apply_fault, image, tof_fault):
+    """
+    Writes one image with the TOF or RGB writer of OfflineImageFault, True
+    when it is written.
+    """
+    try:
+        if tof_fault:
+            return bool(apply_fault.tof_image_writer(image))
+        return bool(apply_fault.rgb_image_writer(image))
+    except Exception as error_msg:
+        print(error_msg)
+        return False
+
+
+def output_unlinker(output_path):
+    """
+    The output may be a hardlink of a normal image from an earlier run,
+    it is removed so that writing the faulty image never changes the source.
+    """
+    if os.path.islink(output_path) or (
+        os.path.exists(output_path) and os.stat(output_path).st_nlink > 1
+    ):
+        os.remove(output_path)
+
+
+def fault_job_runner(
+    fault_jobs,
+    ndir_name,
+    fdir_name,
+    fault_type,
+    fault_rate,
+    workers=1,
+    copy_mode=None,
+    batch_size=1,
+    stream_stages=None,
+    queue_depth=8,
+    manifest=None,
+    fi_cache=None,
+    image_pack=None,
+    tiling=None,
+    output_codec=None,
+    encode_threads=1,
+    shard_size=None,
+    img_sources=None,
+    job_shard=None,
+    work_queue=None,
+    executor="auto",
+    noise_seed=None,
+):
+    """
+    Runs the fault jobs, (image name, fault type, image format) tuples,
+    serially (workers=1) or spreads them across a pool of worker processes.
+    With batch_size > 1 the jobs are sent to the workers in batches. With
+    stream_stages, every worker process runs a streaming pipeline over its
+    share of the jobs (batch_size is not used then).
+    With a manifest (fi_manifest.FIManifest), the completed jobs of an earlier
+    run are skipped and every completed job is recorded as soon as its result
+    arrives. With fi_cache (fi_cache.FICache), the workers reuse the cached
+    outputs and add the new outputs to the cache. With image_pack
+    (fi_pack.FIPack), the images are read from the pack instead of being
+    decoded. With tiling, every image is faulted tile by tile in one job.
+    output_codec is the (output format, cv2.imwrite parameters) of the
+    outputs, encode_threads the encoder threads of the batch workers. With
+    shard_size, the outputs are written into tar shards of up to shard_size
+    bytes by shard_fault_worker; with img_sources ({image name: shard path})
+    the images are read from the input shards. With job_shard, (shard index,
+    shard count, seed), only the jobs of that job shard are run (see
+    job_shard_finder). With work_queue (fi_queue.FIQueue), the jobs are added
+    to the queue and run by queue workers (see queue_worker_runner), a
+    RuntimeError is raised when queue batches failed.
+    executor is "thread", "process" or "auto" (see executor_chooser).
+    noise_seed is the run seed of the per-image noise streams, None uses
+    OpenCV's RNG.
+    Returns the names of the written images in the order of the jobs.
+    """
+    if job_shard is not None:
+        shard_index, shard_count, seed = job_shard
+        fault_jobs = [
+            job
+            for job in fault_jobs
+            if job_shard_finder(job[0], seed, shard_count) == shard_index
+        ]
+    if work_queue is not None:
+        # Same folders written differently ("out" and "out/") are one run.
+        run_info = {
+            "ndir_name": os.path.join(os.path.normpath(ndir_name), ""),
+            "fdir_name": os.path.join(os.path.normpath(fdir_name), ""),
+            "fault_type": fault_type,
+            "fault_rate": fault_rate,
+            "copy_mode": copy_mode,
+            "output_codec": output_codec,
+            "noise_seed": noise_seed,
+        }
+        queue_batch = batch_size if batch_size > 1 else DEFAULT_QUEUE_BATCH
+        if work_queue.job_adder(run_info, fault_jobs, queue_batch) == 0:
+            print("Work queue already has the jobs, the run is resumed.")
+        queue_worker_runner(
+            work_queue.queue_path, workers, work_queue.lease_time, executor
+        )
+        failed_count = work_queue.progress().get("failed", 0)
+        if failed_count:
+            raise RuntimeError(
+                str(failed_count)
+                + " work queue batches failed "
+                + str(MAX_ATTEMPTS)
+                + " times, their images are not written."
+            )
+        return work_queue.written_images()
+    if manifest is not None:
+        job_count = len(fault_jobs)
+        fault_jobs = [job for job in fault_jobs if not manifest.is_done(*job)]
+        if len(fault_jobs) != job_count:
+            print(
+                "Resumed run: "
+                + str(job_count - len(fault_jobs))
+                + " completed images skipped."
+            )
+        job_types = {job[0]: job[1:] for job in fault_jobs}
+
+    common_args = (
+        ndir_name,
+        fdir_name,
+        fault_type,
+        fault_rate,
+        copy_mode,
+        fi_cache,
+        image_pack,
+        output_codec,
+    )
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    if shard_size is not None:
+        worker = partial(
+            shard_fault_worker,
+            ndir_name,
+            fdir_name,
+            fault_type,
+            fault_rate,
+            output_codec,
+            shard_size,
+            img_sources,
+            noise_seed=noise_seed,
+        )
+        fault_jobs = shard_job_splitter(fault_jobs, workers, img_sources)
+        if job_shard is not None:
+            fault_jobs = [
+                (job_shard_prefix(prefix, job_shard[0]), jobs)
+                for prefix, jobs in fault_jobs
+            ]
+        batch_size, stream_stages = 1, None
+    elif tiling is not None:
+        worker = partial(
+            image_fault_worker, *common_args, tiling=tiling, noise_seed=noise_seed
+        )
+        batch_size, stream_stages = 1, None
+    elif stream_stages is not None:
+        worker = partial(
+            image_stream_worker,
+            *common_args,
+            stream_stages,
+            queue_depth,
+            noise_seed=noise_seed,
+        )
+        # Every process streams a large share of the jobs.
+        share_count = 1 if workers <= 1 else workers * 4
+        batch_size = max(1, -(-len(fault_jobs) // share_count))
+    elif batch_size > 1:
+        worker = partial(
+            image_batch_fault_worker,
+            *common_args,
+            encode_threads=encode_threads,
+            noise_seed=noise_seed,
+        )
+    else:
+        worker = partial(image_fault_worker, *common_args, noise_seed=noise_seed)
+
+    if shard_size is not None:
+        job_batches = True  # already split by shard_job_splitter
+    else:
+        job_batches = stream_stages is not None or batch_size > 1
+        if job_batches:
+            fault_jobs = [
+                fault_jobs[i : i + batch_size]
+                for i in range(0, len(fault_jobs), batch_size)
+            ]
+
+    written_images = []
+
+    def result_collector(results):
+        for result in results:
+            for img_name, done in result if job_batches else [result]:
+                if not done:
+                    continue
+                written_images.append(img_name)
+                if manifest is not None:
+                    manifest.record(img_name, *job_types[img_name])
+
+    if workers <= 1 or len(fault_jobs) <= 1:
+        result_collector(worker(fault_job) for fault_job in fault_jobs)
+    else:
+        chunksize = max(1, len(fault_jobs) // (workers * 4))
+        with worker_pool(executor_chooser(fault_type, executor), workers) as pool:
+            result_collector(pool.map(worker, fault_jobs, chunksize=chunksize))
+
+    return written_images
+
+
+def queue_worker_runner(
+    queue_path, workers=1, lease_time=DEFAULT_LEASE_TIME, executor="auto"
+):
+    """
+    Runs queue_fault_worker in workers threads/processes (None: all CPU
+    cores) of this machine until the work queue is drained, "auto" chooses
+    by the fault of the queued run. Returns the number of completed batches.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers <= 1:
+        return queue_fault_worker(queue_path, lease_time)
+    if executor == "auto":
+        run_info = FIQueue(queue_path, lease_time).run_info()
+        if run_info is not None:
+            executor = executor_chooser(run_info["fault_type"], executor)
+    with worker_pool(executor, workers) as pool:
+        batch_counts = [
+            pool.submit(queue_fault_worker, queue_path, lease_time)
+            for _ in range(workers)
+        ]
+        return sum(batch_count.result() for batch_count in batch_counts)
+
+
+def executor_chooser(fault_type, executor="auto"):
+    """
+    "thread" or "process" for a fault (or a fault pipeline) and an executor
+    option. "auto" chooses threads when every fault of the pipeline runs in
+    OpenCV (THREAD_FAULTS): OpenCV releases the GIL while decoding, faulting
+    and encoding, so threads scale without pickling the jobs and results.
+    """
+    if executor not in EXECUTORS:
+        raise ValueError("Unknown executor: " + str(executor))
+    if executor != "auto":
+        return executor
+    if isinstance(fault_type, (list, tuple)):
+        pipe_types = [pipe_type for pipe_type, _ in fault_type]
+    else:
+        pipe_types = [fault_type]
+    if all(pipe_type in THREAD_FAULTS for pipe_type in pipe_types):
+        return "thread"
+    return "process"
+
+
+@contextlib.contextmanager
+def worker_pool(executor, workers):
+    """
+    Thread or process pool of workers. OpenCV's internal threads are limited
+    to cpu_count // workers in every worker (cv2.setNumThreads), so the pool
+    and OpenCV do not oversubscribe the cores. A thread pool shares one
+    setting, the old value is restored when the pool is closed.
+    """
+    cv2_threads = max(1, (os.cpu_count() or 1) // workers)
+    if executor == "thread":
+        old_threads = cv2.getNumThreads()
+        cv2.setNumThreads(cv2_threads)
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                yield pool
+        finally:
+            cv2.setNumThreads(old_threads)
+    else:
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=cv2.setNumThreads,
+            initargs=(cv2_threads,),
+        ) as pool:
+            yield pool
+
+
+def queue_fault_worker(queue_path, lease_time=DEFAULT_LEASE_TIME):
+    """
+    Queue worker process: leases the batches of the work queue and runs
+    their jobs with image_fault_worker, the run information comes from the
+    queue. Returns the number of completed batches.
+    """
+    fi_queue = FIQueue(queue_path, lease_time)
+    run_info = fi_queue.run_info()
+    if run_info is None:
+        print("The work queue has no jobs: " + queue_path)
+        return 0
+    worker = partial(
+        image_fault_worker,
+        run_info["ndir_name"],
+        run_info["fdir_name"],
+        run_info["fault_type"],
+        run_info["fault_rate"],
+        run_info["copy_mode"],
+        None,
+        None,
+        run_info["output_codec"],
+        noise_seed=run_info.get("noise_seed"),
+    )
+    return fi_queue.batch_runner(worker)
+
+
+def shard_job_splitter(fault_jobs, workers, img_sources=None):
+    """
+    Splits the fault jobs into (output shard prefix, jobs) shard jobs: one
+    per input shard with img_sources, otherwise one per worker share.
+    """
+    if img_sources is not None:
+        shard_jobs = {}
+        for job in fault_jobs:
+            shard_jobs.setdefault(img_sources[job[0]], []).append(job)
+        return [
+            (shard_stem(shard_path), jobs) for shard_path, jobs in shard_jobs.items()
+        ]
+    share_count = 1 if workers <= 1 else workers * 4
+    share_size = max(1, -(-len(fault_jobs) // share_count))
+    return [
+        ("faulty-" + str(i // share_size).zfill(4), fault_jobs[i : i + share_size])
+        for i in range(0, len(fault_jobs), share_size)
+    ]
+
+
+def shard_fault_worker(
+    ndir_name,
+    fdir_name,
+    fault_type,
+    fault_rate,
+    output_codec,
+    shard_size,
+    img_sources,
+    shard_job,
+    noise_seed=None,
+):
+    """
+    Writes the images of a shard job (output shard prefix, fault jobs) into
+    tar shards of up to shard_size bytes with a JSON label per image (see
+    fi_shards.py). With img_sources the images are read from the stream of
+    their input shard (one input shard per shard job), otherwise from the
+    image files of ndir_name. Like copy_mode, the images without fault are
+    stored without decoding when the output format does not change.
+    """
+    prefix, fault_jobs = shard_job
+    tof_fault = ofi.tof_fault_check(fault_type)
+    job_info = {job[0]: job[1:] for job in fault_jobs}
+    done_images = {}
+
+    if img_sources is not None:
+        source = img_sources[fault_jobs[0][0]]
+        samples = shard_sample_reader(source)
+    else:
+        source = ndir_name
+        samples = image_file_reader(ndir_name, fault_jobs)
+
+    with ShardWriter(fdir_name, prefix, shard_size) as shard_writer:
+        for img_name, sample in samples:
+            if img_name not in job_info:
+                continue
+            img_fault_type, img_format = job_info[img_name]
+            out_format = output_format_finder(img_format, output_codec)
+            try:
+                data = sample[img_format]
+                if img_fault_type != "nf" or out_format != img_format:
+                    data = image_bytes_fault(
+                        data,
+                        img_fault_type,
+                        fault_rate,
+                        tof_fault,
+                        out_format,
+                        [] if output_codec is None else output_codec[1],
+                        image_rng_finder(noise_seed, img_name, img_fault_type),
+                    )
+                label = sample_label(
+                    img_name,
+                    img_format,
+                    source,
+                    img_fault_type,
+                    fault_rate,
+                    sample.get(".json"),
+                )
+                shard_writer.write(img_name, {out_format: data, ".json": label})
+            except Exception as error_msg:
+                print(error_msg)
+                continue
+            done_images[img_name] = True
+
+    return [(job[0], done_images.get(job[0], False)) for job in fault_jobs]
+
+
+def image_file_reader(ndir_name, fault_jobs):
+    """
+    Yields the (image name, {image format: bytes}) samples of the image files
+    of the fault jobs, in the order of the jobs.
+    """
+    for img_name, _, img_format in fault_jobs:
+        try:
+            with open(ndir_name + img_name + img_format, "rb") as image_file:
+                yield img_name, {img_format: image_file.read()}
+        except OSError as error_msg:
+            print(error_msg)
+
+
+def image_bytes_fault(
+    data, img_fault_type, fault_rate, tof_fault, out_format, codec_params, rng=None
+):
+    """
+    Decodes an encoded image like the OfflineImageFault readers, applies the
+    fault ("nf": none) with the noise Generator rng and returns the image
+    encoded in out_format.
+    """
+    if tof_fault:
+        image = ofi.tof_decoder(data)
+    else:
+        image = ofi.cv2_decoder(data)
+    if image is None:
+        raise IOError("Image cannot be decoded")
+    if img_fault_type != "nf":
+        image = ofi.image_fault(image, img_fault_type, fault_rate, rng)
+    if tof_fault:
+        image = ofi.gray_converter(image)
+    done, encoded = cv2.imencode(out_format, image, codec_params)
+    if not done:
+        raise IOError("Image cannot be encoded to " + out_format)
+    return encoded.tobytes()
+
+
+def image_rng_finder(noise_seed, img_name, img_fault_type):
+    """
+    Noise Generator of a faulty image, the stream of the image name in the
+    run seed (noise_kernels.image_rng). None without a seed, for the images
+    without fault and for the faults without noise.
+    """
+    if noise_seed is None or not ofi.noise_fault_check(img_fault_type):
+        return None
+    return image_rng(noise_seed, img_name)
+
+
+def image_copier(src_path, dst_path, copy_mode="copy"):
+    """
+    Writes an image to the output folder without decoding it. "hardlink" and
+    "reflink" fall back to a byte copy when the file system does not support them.
+    Returns True when the image is written.
+    """
+    if copy_mode not in COPY_MODES:
+        raise ValueError("Unknown copy mode: " + str(copy_mode))
+
+    try:
+        if os.path.lexists(dst_path):
+            os.remove(dst_path)
+
+        if copy_mode == "hardlink":
+            try:
+                os.link(src_path, dst_path)
+                return True
+            except OSError:
+                pass
+        elif copy_mode == "reflink" and fcntl is not None:
+            try:
+                with open(src_path, "rb") as src_file, open(dst_path, "wb") as dst_file:
+                    fcntl.ioctl(dst_file.fileno(), FICLONE, src_file.fileno())
+                return True
+            except OSError:
+                pass
+
+        shutil.copyfile(src_path, dst_path)
+        return True
+    except OSError as error_msg:
+        print(error_msg)
+        return False
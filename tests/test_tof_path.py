@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+TOF Fault Path Tests For Camera FI Demo Tool
+-----------------------------------------------
+The single-decode TOF path of OfflineImageFault (tof_decoder, the native
+noise kernels in place, gray_converter) must give the same grayscale outputs
+as the PIL path (np.asarray(Image.open(...)), Image.fromarray(...).convert("L"))
+with the same noise Generator.
+
+Usage: python -m pytest tests
+"""
+
+import os
+import sys
+import numpy as np
+import pytest
+from PIL import Image
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+import noise_kernels as nk  # noqa: E402
+from class_fi_offline_ui import OfflineImageFault as ofi  # noqa: E402
+from fi_discovery import image_scanner  # noqa: E402
+
+TOF_FOLDER = os.path.join(ROOT_DIR, "images", "normal_image_folders", "tof_images")
+FAULT_RATE = 0.1
+FAULTS = ("nf", "s", "g", "p")
+
+
+def noise_fault(image, fault_type, rng, out=None):
+    """TOF fault of tof_image_fault with a noise Generator"""
+    if fault_type == "s":
+        return nk.salt_pepper(image, FAULT_RATE, rng, out=out)
+    if fault_type == "g":
+        return nk.gaussian_noise(image, FAULT_RATE * 255, rng, out=out)
+    if fault_type == "p":
+        return nk.poisson_noise(image, float(FAULT_RATE * 100), rng, out=out)
+    return image
+
+
+def pil_tof_path(img_path, fault_type, rng):
+    """PIL decode and grayscale conversion"""
+    im_arr = np.asarray(Image.open(img_path))
+    im_arr = noise_fault(im_arr, fault_type, rng)
+    return np.array(Image.fromarray(im_arr).convert("L"))
+
+
+def decoder_tof_path(img_path, fault_type, rng):
+    """Single-decode TOF path of OfflineImageFault"""
+    im_arr = ofi.tof_decoder(img_path)
+    out = im_arr if im_arr.flags.writeable else None
+    im_arr = noise_fault(im_arr, fault_type, rng, out=out)
+    return ofi.gray_converter(im_arr)
+
+
+def folder_images():
+    """Images of the TOF image folder"""
+    ndir_name = os.path.join(TOF_FOLDER, "")
+    return [
+        ndir_name + img_name + img_format
+        for img_name, img_format in image_scanner(ndir_name).items()
+    ]
+
+
+@pytest.fixture(scope="module")
+def generated_images(tmp_path_factory):
+    """L/RGB/RGBA test images in PNG and BMP format"""
+    temp_dir = tmp_path_factory.mktemp("tof_images")
+    rng = np.random.default_rng(0)
+    img_paths = []
+    for mode, shape in (("L", (61, 83)), ("RGB", (61, 83, 3)), ("RGBA", (61, 83, 4))):
+        image = Image.fromarray(rng.integers(0, 256, shape, dtype=np.uint8), mode)
+        for img_format in (".png", ".bmp"):
+            if mode == "RGBA" and img_format == ".bmp":
+                continue
+            img_path = str(temp_dir / (mode + img_format))
+            image.save(img_path)
+            img_paths.append(img_path)
+    return img_paths
+
+
+def assert_same_outputs(img_paths, fault_type):
+    for img_path in img_paths:
+        pil_out = pil_tof_path(img_path, fault_type, np.random.default_rng(1))
+        decoder_out = decoder_tof_path(img_path, fault_type, np.random.default_rng(1))
+        assert decoder_out.dtype == pil_out.dtype, img_path
+        assert np.array_equal(decoder_out, pil_out), img_path
+
+
+@pytest.mark.parametrize("fault_type", FAULTS)
+def test_generated_images(generated_images, fault_type):
+    assert_same_outputs(generated_images, fault_type)
+
+
+@pytest.mark.parametrize("fault_type", FAULTS)
+def test_tof_folder(fault_type):
+    img_paths = folder_images()
+    assert img_paths
+    assert_same_outputs(img_paths, fault_type)
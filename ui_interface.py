@@ -419,6 +419,9 @@ class Ui_MainWindow(object):
         self.randomize_check = QtWidgets.QCheckBox(self.right_bottom_frame)
         self.randomize_check.setObjectName("randomize_check")
         self.gridLayout_2.addWidget(self.randomize_check, 3, 0, 1, 1)
+        self.apply_fi_plan_check = QtWidgets.QCheckBox(self.right_bottom_frame)
+        self.apply_fi_plan_check.setObjectName("apply_fi_plan_check")
+        self.gridLayout_2.addWidget(self.apply_fi_plan_check, 3, 1, 1, 1)
         self.gridLayout_3.addWidget(self.right_bottom_frame, 2, 0, 1, 1)
         self.right_upper_frame = QtWidgets.QFrame(self.right_body_cont_frame)
         sizePolicy = QtWidgets.QSizePolicy(QtWidgets.QSizePolicy.Preferred, QtWidgets.QSizePolicy.Expanding)
@@ -655,6 +658,7 @@ class Ui_MainWindow(object):
         self.save_fi_plan_button.setText(_translate("MainWindow", "  Save FI Plan  "))
         self.apply_fault_button.setText(_translate("MainWindow", "Apply Fault"))
         self.randomize_check.setText(_translate("MainWindow", "Randomize"))
+        self.apply_fi_plan_check.setText(_translate("MainWindow", "Apply FI Plan"))
         self.info_label.setText(_translate("MainWindow", "Info"))
         self.fi_plan_label.setText(_translate("MainWindow", "FI Plans"))
         self.progressBar_label.setText(_translate("MainWindow", "FI Applying Progress"))